@@ -69,6 +69,14 @@ class PipelineParams(ParamGroup):
         self.convert_SHs_python = False
         self.compute_cov3D_python = False
         self.debug = False
+        self.deform_batch_memory_mb = 1024
+        # LRU cache of deformed states for renders that revisit the same times (e.g. a viewer, or the FPS loop of
+        # render.py, which then also reports its FPS with the cache); 10 floats per Gaussian and cached frame, 0 disables
+        self.deform_cache_mb = 0
+        self.sequential_tolerance = 0.0
+        self.time_index_tolerance = 0.0
+        # frustum culling with the motion bounds of every Gaussian, for models that are not being trained
+        self.motion_culling = False
         super().__init__(parser, "Pipeline Parameters")
 
         
@@ -87,6 +95,20 @@ class FDMHiddenParams(ParamGroup):
         self.ch_num = 10
         self.curve_num = 17
         self.init_param = 0.01
+        self.deform_basis = "gaussian"
+        self.fused_deformation = True
+        self.sparse_topk = 0
+        self.deformation_checkpoint = False
+        self.compile_deformation = False
+        self.compile_mode = "default"
+        self.motion_rank = 16
+        self.motion_knots = 64
+        # storage precision of _coefs and of its Adam moments (float32 or bfloat16). With coefs_rounding "master",
+        # bfloat16 coefficients keep an fp32 master copy and use as much memory as float32 ones: only
+        # coefs_state_dtype bfloat16 or coefs_rounding "stochastic" save memory (see memory_report)
+        self.coefs_dtype = "float32"
+        self.coefs_state_dtype = "float32"
+        self.coefs_rounding = "master"
         
         super().__init__(parser, "FDMHiddenParams")
 
@@ -125,6 +147,39 @@ class OptimizationParams(ParamGroup):
         self.opacity_threshold_coarse = 0.005
         self.opacity_threshold_fine_init = 0.005
         self.opacity_threshold_fine_after = 0.005
+        self.sparsify_interval = 1000
+        # every re-sparsification swaps up to sparse_regrow_fraction of the kept kernels (smallest |weight|) for the dropped
+        # kernels with the largest gradient at zero weight, accumulated over its last sparse_score_iters iterations
+        self.sparse_regrow_fraction = 0.1
+        self.sparse_score_iters = 100
+        # with sparse_topk, all kernels are trained until the first sparsification at or after sparsify_from_iter
+        self.sparsify_from_iter = 1000
+        # _deformation_accum is collected every deformation_stats_interval iterations (0: never)
+        # on a random deformation_stats_fraction of the dynamic Gaussians
+        self.deformation_stats_interval = 1
+        self.deformation_stats_fraction = 1.0
+        # before every densification, Gaussians whose mean |xyz offset| since the last one is at most
+        # deformation_table_threshold become static and drop their coefficients (0: all stay dynamic)
+        self.deformation_table_threshold = 0.0
+        # Gaussians with an average view-space gradient of at least deformation_promote_threshold are (or become) dynamic
+        self.deformation_promote_threshold = 0.0002
+        # update only the Gaussians in the visibility filter of the iteration (lazy Adam)
+        self.sparse_adam = False
+        self.sparse_adam_row_bias_correction = False
+        # upper bound on the number of Gaussians (0: unbounded); at the budget, densification may evict up to
+        # max_gaussians_evict_fraction of it per step to make room for the candidates with the largest gradients
+        self.max_gaussians = 0
+        # reorder the Gaussians along a Morton curve after every densification and in the saved point clouds
+        self.morton_sort = False
+        self.max_gaussians_evict_fraction = 0.02
+        # skip densification passes with less than densify_min_candidate_fraction of the Gaussians above the gradient
+        # threshold and stop densifying after densify_patience passes in a row added less than densify_converged_growth
+        # of them; skip pruning passes that would remove less than prune_min_fraction of them
+        self.adaptive_densification = False
+        self.densify_min_candidate_fraction = 0.002
+        self.densify_converged_growth = 0.005
+        self.densify_patience = 3
+        self.prune_min_fraction = 0.001
         
         super().__init__(parser, "Optimization Parameters")
 
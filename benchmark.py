@@ -0,0 +1,546 @@
+#
+# Micro-benchmarks for the deformation and densification code paths.
+# Usage: python benchmark.py deformation --num_points 1000000 --device cuda
+#
+import itertools
+import time
+import torch
+from argparse import ArgumentParser, Namespace
+from torch.utils.checkpoint import checkpoint
+
+from scene.deformation_kernels import deformation_window, windowed_gaussian_deformation, windowed_gaussian_deformation_reference, batched_gaussian_deformation, \
+    topk_kernel_index, kernel_index_dtype, gather_kernels, sparse_gaussian_deformation, IncrementalGaussianDeformation, gaussian_activity_intervals
+from scene.time_index import TimeIntervalIndex
+from scene.temporal_basis import BASIS_TYPES
+from scene.model_sizing import estimate_model_memory, max_gaussians, format_memory_report
+from scene.mixed_precision import DTYPES, MixedPrecisionAdam
+from scene.capacity_storage import CapacityStorage
+from scene.sparse_adam import SparseAdam
+from utils.graphics_utils import morton_codes
+
+CH_NUM = 10
+CURVE_NUM = 20
+GM_NUM = 8
+# floats per Gaussian of every parameter (sh degree 3); each one also carries exp_avg and exp_avg_sq
+GAUSSIAN_WIDTHS = {"xyz": 3, "f_dc": 3, "f_rest": 45, "opacity": 1, "scaling": 3, "rotation": 4, "coefs": CH_NUM * 3 * CURVE_NUM}
+OPTIMIZER_KEYS = [name + suffix for name in GAUSSIAN_WIDTHS for suffix in ("", ".exp_avg", ".exp_avg_sq")]
+
+
+def random_coefs(num_points, device, ch_num=CH_NUM, curve_num=CURVE_NUM):
+    weight = torch.randn((num_points, ch_num, curve_num), device=device) * 0.01
+    position = torch.zeros((num_points, ch_num, curve_num), device=device) + torch.linspace(0, 1, curve_num, device=device)
+    shape = torch.zeros((num_points, ch_num, curve_num), device=device) + 0.01
+    return torch.stack((weight, position, shape), dim=2).reshape(num_points, -1).contiguous()
+
+
+def synchronize(device):
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+
+
+def reset_peak_memory(device):
+    if device.startswith("cuda"):
+        torch.cuda.empty_cache()
+        torch.cuda.reset_peak_memory_stats()
+
+
+def peak_memory_mb(device):
+    if device.startswith("cuda"):
+        return torch.cuda.max_memory_allocated() / 2**20
+    return float("nan")
+
+
+def timeit(fn, device, iters, warmup=2):
+    for _ in range(warmup):
+        fn()
+    synchronize(device)
+    reset_peak_memory(device)
+    start = time.time()
+    for _ in range(iters):
+        fn()
+    synchronize(device)
+    return (time.time() - start) / iters, peak_memory_mb(device)
+
+
+def report(name, seconds, peak_mb, unit="frame"):
+    peak = "n/a" if peak_mb != peak_mb else "{:.1f}".format(peak_mb)
+    print("{:<28s} {:>10.3f} ms/{} {:>10.1f} {}s/s {:>10s} MB peak".format(name, seconds * 1000, unit, 1.0 / seconds, unit, peak))
+
+
+def bench_deformation(args):
+    coefs = torch.nn.Parameter(random_coefs(args.num_points, args.device))
+    view = lambda: coefs.view(args.num_points, CH_NUM, 3, CURVE_NUM)
+    times = torch.rand(args.iters + 2).tolist()
+
+    # numerical parity against the autograd reference
+    t = torch.tensor(0.37, device=args.device)
+    min_idx, max_idx = deformation_window(t, CURVE_NUM, GM_NUM)
+    grad = torch.randn((args.num_points, CH_NUM), device=args.device)
+    out_fused = windowed_gaussian_deformation(view(), t, min_idx, max_idx)
+    grad_fused, = torch.autograd.grad((out_fused * grad).sum(), coefs)
+    out_ref = windowed_gaussian_deformation_reference(view(), t, min_idx, max_idx)
+    grad_ref, = torch.autograd.grad((out_ref * grad).sum(), coefs)
+    print("max |forward diff| : {:.3e}".format((out_fused - out_ref).abs().max().item()))
+    print("max |backward diff|: {:.3e}".format((grad_fused - grad_ref).abs().max().item()))
+    del out_fused, out_ref, grad_fused, grad_ref
+
+    for name, fn in [("reference", windowed_gaussian_deformation_reference), ("fused", windowed_gaussian_deformation)]:
+        frame = itertools.cycle(times)
+
+        def step():
+            t = next(frame)
+            min_idx, max_idx = deformation_window(t, CURVE_NUM, GM_NUM)
+            with torch.set_grad_enabled(args.backward):
+                out = fn(view(), t, min_idx, max_idx)
+            if args.backward:
+                out.sum().backward()
+                coefs.grad = None
+
+        seconds, peak_mb = timeit(step, args.device, args.iters)
+        report(name, seconds, peak_mb)
+
+
+@torch.no_grad()
+def bench_deform_batch(args):
+    coefs = random_coefs(args.num_points, args.device).view(args.num_points, CH_NUM, 3, CURVE_NUM)
+    times = torch.linspace(0, 1, args.num_frames, device=args.device)
+    frame_bytes = 4 * args.num_points * CH_NUM * (CURVE_NUM + 1)
+    frames_per_chunk = max(1, int(args.memory_budget_mb * 2**20) // frame_bytes)
+
+    def per_frame():
+        for t in times.tolist():
+            min_idx, max_idx = deformation_window(t, CURVE_NUM, GM_NUM)
+            windowed_gaussian_deformation(coefs, t, min_idx, max_idx)
+
+    def batched():
+        batched_gaussian_deformation(coefs, times, frames_per_chunk)
+
+    print("frames per chunk: {}".format(frames_per_chunk))
+    for name, fn in [("per-frame", per_frame), ("deform_batch", batched)]:
+        seconds, peak_mb = timeit(fn, args.device, args.iters, warmup=1)
+        report(name, seconds / args.num_frames, peak_mb)
+
+
+def bench_sparse(args):
+    coefs = random_coefs(args.num_points, args.device).view(args.num_points, CH_NUM, 3, CURVE_NUM)
+    # most Gaussians only use a few kernels: decay the weights by a random per-kernel rank
+    decay = torch.rand((args.num_points, CH_NUM, CURVE_NUM), device=args.device).argsort(-1).float()
+    coefs[:, :, 0] *= torch.exp(-decay)
+    coefs = torch.nn.Parameter(coefs)
+    index = topk_kernel_index(coefs.detach(), args.topk)
+    # the _coefs parameter and _sparse_index of a sparse GaussianModel
+    packed = torch.nn.Parameter(gather_kernels(coefs.detach(), index))
+    index = index.to(kernel_index_dtype(CURVE_NUM))
+
+    with torch.no_grad():
+        times = torch.linspace(0, 1, 50, device=args.device)
+        dense_deform = batched_gaussian_deformation(coefs, times, 1)
+        sparse_deform = batched_gaussian_deformation(packed, times, 1)
+        print("top-{} max |deformation error|: {:.3e} (mean {:.3e})".format(
+            args.topk, (dense_deform - sparse_deform).abs().max().item(), (dense_deform - sparse_deform).abs().mean().item()))
+    dense_mb = coefs.numel() * coefs.element_size() / 2**20
+    packed_mb = packed.numel() * packed.element_size() / 2**20
+    index_mb = index.numel() * index.element_size() / 2**20
+    print("coefficients: dense {:.1f} MB, packed {:.1f} MB + {} kernel index {:.1f} MB".format(dense_mb, packed_mb, index.dtype, index_mb))
+    # the gradient and both Adam moments have the size of the parameter
+    print("with gradient and Adam moments: dense {:.1f} MB, packed {:.1f} MB".format(4 * dense_mb, 4 * packed_mb + index_mb))
+
+    frame = itertools.cycle(torch.rand(args.iters + 2).tolist())
+
+    def dense():
+        t = next(frame)
+        min_idx, max_idx = deformation_window(t, CURVE_NUM, GM_NUM)
+        with torch.set_grad_enabled(args.backward):
+            out = windowed_gaussian_deformation(coefs, t, min_idx, max_idx)
+        if args.backward:
+            out.sum().backward()
+            coefs.grad = None
+
+    def sparse():
+        with torch.set_grad_enabled(args.backward):
+            out = sparse_gaussian_deformation(packed, next(frame))
+        if args.backward:
+            out.sum().backward()
+            packed.grad = None
+
+    for name, fn in [("dense", dense), ("top-{}".format(args.topk), sparse)]:
+        seconds, peak_mb = timeit(fn, args.device, args.iters)
+        report(name, seconds, peak_mb)
+
+
+def bench_basis(args):
+    hyper = Namespace(fused_deformation=True, motion_rank=args.motion_rank, motion_knots=64)
+    frame = itertools.cycle(torch.rand(args.iters + 2).tolist())
+    for curve_num in args.curve_nums:
+        for name, basis_type in sorted(BASIS_TYPES.items()):
+            basis = basis_type(CH_NUM, curve_num, hyper).to(args.device)
+            coefs = torch.nn.Parameter(basis.initial_coefs(args.num_points, 0.01).to(args.device))
+
+            def step():
+                with torch.set_grad_enabled(args.backward):
+                    out = basis.evaluate(basis.view(coefs), next(frame))
+                if args.backward:
+                    out.sum().backward()
+                    coefs.grad = None
+
+            seconds, peak_mb = timeit(step, args.device, args.iters)
+            report("{} C={}".format(name, curve_num), seconds, peak_mb)
+            del coefs
+
+
+@torch.no_grad()
+def bench_sequential(args):
+    # video split: frames rendered in temporal order, consecutive frames 1/num_frames apart
+    coefs = random_coefs(args.num_points, args.device).view(args.num_points, CH_NUM, 3, CURVE_NUM)
+    # most kernels of a trained model carry (near) zero weight
+    coefs[:, :, 0].normal_(0, 0.01).mul_(torch.rand_like(coefs[:, :, 0]) < args.active_fraction)
+    coefs[:, :, 2].uniform_(0.02, 0.1)
+    times = torch.linspace(0, 1, args.num_frames).tolist()
+
+    max_error, max_bound = 0.0, 0.0
+    incremental = IncrementalGaussianDeformation(coefs, args.tolerance)
+    for t in times:
+        approx = incremental(t)
+        exact = windowed_gaussian_deformation(coefs, t, 0, CURVE_NUM)
+        error = (approx - exact).abs()
+        bound = incremental.error_bound(t)
+        assert (error <= bound + 1e-6).all(), "incremental deformation exceeded its error bound"
+        max_error, max_bound = max(max_error, error.max().item()), max(max_bound, bound.max().item())
+    print("tolerance {:.1e}: max |error| {:.3e}, max bound {:.3e}, re-evaluated {:.1%} of the kernels".format(
+        args.tolerance, max_error, max_bound, incremental.stats()["evaluated_fraction"]))
+
+    def exact_playback():
+        for t in times:
+            min_idx, max_idx = deformation_window(t, CURVE_NUM, GM_NUM)
+            windowed_gaussian_deformation(coefs, t, min_idx, max_idx)
+
+    def incremental_playback():
+        playback = IncrementalGaussianDeformation(coefs, args.tolerance)
+        for t in times:
+            playback(t)
+
+    for name, fn in [("exact", exact_playback), ("incremental", incremental_playback)]:
+        seconds, peak_mb = timeit(fn, args.device, args.iters, warmup=1)
+        report(name, seconds / args.num_frames, peak_mb)
+
+
+@torch.no_grad()
+def bench_time_index(args):
+    # instruments entering and leaving: every Gaussian only moves during a random window of the sequence
+    coefs = random_coefs(args.num_points, args.device).view(args.num_points, CH_NUM, 3, CURVE_NUM)
+    coefs[:, :, 2] = 0.03
+    enter = torch.rand((args.num_points, 1, 1), device=args.device) * (1 - args.active_fraction)
+    mu = coefs[:, :, 1]
+    coefs[:, :, 0] *= ((mu >= enter) & (mu <= enter + args.active_fraction)).float()
+    times = torch.linspace(0, 1, args.num_frames, device=args.device)
+    index = TimeIntervalIndex(*gaussian_activity_intervals(coefs, args.tolerance))
+
+    def culled(t):
+        deform = coefs.new_zeros((args.num_points, CH_NUM))
+        active = index.active(t)
+        deform[active] = batched_gaussian_deformation(coefs[active], times.new_tensor([t]), 1)[0]
+        return deform
+
+    max_error = 0.0
+    for t in times.tolist():
+        exact = batched_gaussian_deformation(coefs, times.new_tensor([t]), 1)[0]
+        max_error = max(max_error, (culled(t) - exact).abs().max().item())
+    print("tolerance {:.1e}: max |error| {:.3e} (bound {:.3e}), {:.1%} of the Gaussians active per frame".format(
+        args.tolerance, max_error, CURVE_NUM * args.tolerance, index.stats()["active_fraction"]))
+
+    def exact_playback():
+        for t in times.tolist():
+            batched_gaussian_deformation(coefs, times.new_tensor([t]), 1)
+
+    def culled_playback():
+        for t in times.tolist():
+            culled(t)
+
+    for name, fn in [("all Gaussians", exact_playback), ("time index", culled_playback)]:
+        seconds, peak_mb = timeit(fn, args.device, args.iters, warmup=1)
+        report(name, seconds / args.num_frames, peak_mb)
+
+
+def saved_tensor_mb(fn, exclude):
+    # memory autograd keeps alive for backward while running fn, tensors sharing storage with exclude (the parameters) not counted
+    storages = {}
+
+    def pack(tensor):
+        ptr = tensor.untyped_storage().data_ptr()
+        if ptr not in exclude:
+            storages[ptr] = tensor.untyped_storage().nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        out = fn()
+    return out, sum(storages.values()) / 2**20
+
+
+def bench_checkpoint(args):
+    # activation memory of one training step of the deformation with and without recomputation
+    for num_points in args.point_counts:
+        coefs = torch.nn.Parameter(random_coefs(num_points, args.device))
+        coefs_bf16 = torch.nn.Parameter(coefs.detach().bfloat16())
+        kernels = coefs.detach().view(num_points, CH_NUM, 3, CURVE_NUM)
+        packed = torch.nn.Parameter(gather_kernels(kernels, topk_kernel_index(kernels, args.topk)))
+        t = 0.37
+        min_idx, max_idx = deformation_window(t, CURVE_NUM, GM_NUM)
+        paths = [
+            ("reference", coefs, lambda c: windowed_gaussian_deformation_reference(c.view(num_points, CH_NUM, 3, CURVE_NUM), t, min_idx, max_idx)),
+            ("fused", coefs, lambda c: windowed_gaussian_deformation(c.view(num_points, CH_NUM, 3, CURVE_NUM), t, min_idx, max_idx)),
+            ("fused bf16", coefs_bf16, lambda c: windowed_gaussian_deformation(c.view(num_points, CH_NUM, 3, CURVE_NUM).float(), t, min_idx, max_idx)),
+            ("top-{}".format(args.topk), packed, lambda c: sparse_gaussian_deformation(c, t)),
+        ]
+        for name, param, fn in paths:
+            for recompute in [False, True]:
+                def step():
+                    out = checkpoint(fn, param, use_reentrant=False) if recompute else fn(param)
+                    return out
+
+                reset_peak_memory(args.device)
+                out, saved_mb = saved_tensor_mb(step, {param.untyped_storage().data_ptr()})
+                out.sum().backward()
+                param.grad = None
+                synchronize(args.device)
+                peak = peak_memory_mb(args.device)
+                print("N={:<9d} {:<12s} {:<10s} saved for backward {:>9.1f} MB, peak {:>9s} MB".format(
+                    num_points, name, "recompute" if recompute else "store", saved_mb, "n/a" if peak != peak else "{:.1f}".format(peak)))
+                del out
+        del coefs, coefs_bf16
+
+
+def bench_compile(args):
+    # render_flow attribute assembly (deformation of the dynamic half, concat, activations): eager vs torch.compile
+    hyper = Namespace(fused_deformation=True, motion_rank=args.motion_rank, motion_knots=64)
+    n_dynamic = args.num_points // 2
+    xyz = torch.nn.Parameter(torch.randn((args.num_points, 3), device=args.device))
+    scaling = torch.nn.Parameter(torch.randn((args.num_points, 3), device=args.device) - 4)
+    rotation = torch.nn.Parameter(torch.randn((args.num_points, 4), device=args.device))
+    opacity = torch.nn.Parameter(torch.randn((args.num_points, 1), device=args.device))
+    times = [torch.tensor(t, device=args.device) for t in torch.rand(args.iters + 2).tolist()]
+    for name, basis_type in sorted(BASIS_TYPES.items()):
+        basis = basis_type(CH_NUM, CURVE_NUM, hyper).to(args.device)
+        coefs = torch.nn.Parameter(basis.initial_coefs(n_dynamic, 0.01).to(args.device) + 0.01)
+
+        def assemble(evaluate, t):
+            deform = evaluate(basis.view(coefs), t)
+            means3D = torch.cat((xyz[:n_dynamic] + deform[:, :3], xyz[n_dynamic:]))
+            rotations = torch.cat((rotation[:n_dynamic] + deform[:, 3:7], rotation[n_dynamic:]))
+            scales = torch.cat((scaling[:n_dynamic] + deform[:, 7:10], scaling[n_dynamic:]))
+            return means3D, torch.clip(torch.exp(scales), max=2), torch.nn.functional.normalize(rotations), torch.sigmoid(opacity)
+
+        compiled = torch.compile(lambda t: assemble(basis.evaluate_static, t), dynamic=True)
+        paths = [
+            ("eager", lambda t: assemble(basis.evaluate, t)),
+            ("eager static", lambda t: assemble(basis.evaluate_static, t)),
+            ("compiled", compiled),
+        ]
+        for path, fn in paths:
+            frame = itertools.cycle(times)
+
+            def step():
+                with torch.set_grad_enabled(args.backward):
+                    out = fn(next(frame))
+                if args.backward:
+                    sum(o.sum() for o in out).backward()
+                    for p in (coefs, xyz, scaling, rotation, opacity):
+                        p.grad = None
+
+            seconds, peak_mb = timeit(step, args.device, args.iters, warmup=3)
+            report("{} {}".format(name, path), seconds, peak_mb)
+        del coefs
+
+
+def gaussian_tensors(num_points, device):
+    return {key: torch.randn((num_points, GAUSSIAN_WIDTHS[key.split(".")[0]]), device=device) for key in OPTIMIZER_KEYS}
+
+
+@torch.no_grad()
+def bench_densify(args):
+    # one densification of 5% clones and 5% splits (N=2) on parameters and Adam moments: clone, split and
+    # prune passes (torch.cat / CapacityStorage) vs the single fused update of densify_and_clone_split.
+    # The peak only counts memory allocated by the densification itself. Sized for e.g. --point_counts 500000 1000000 2000000.
+    for num_points in args.point_counts:
+        for name in ["cat", "capacity", "capacity fused"]:
+            seconds, peaks = 0.0, []
+            for _ in range(args.iters):
+                tensors, storage = gaussian_tensors(num_points, args.device), CapacityStorage()
+                if name != "cat":
+                    # steady state of the storage: the buffers already have spare capacity
+                    tensors = {key: storage.append(key, value, value[:0]) for key, value in tensors.items()}
+                selected = torch.rand(num_points, device=args.device)
+                clone, split = (selected < 0.05).nonzero().squeeze(1), (selected > 0.95).nonzero().squeeze(1)
+                keep = torch.ones(num_points + clone.shape[0] + 2 * split.shape[0], dtype=torch.bool, device=args.device)
+                keep[split] = False
+                synchronize(args.device)
+                reset_peak_memory(args.device)
+                start = time.time()
+                for key, value in tensors.items():
+                    if name == "cat":
+                        value = torch.cat((value, value[clone]))
+                        value = torch.cat((value, value[split].repeat(2, 1)))
+                        tensors[key] = value[keep]
+                    elif name == "capacity":
+                        value = storage.append(key, value, value[clone])
+                        value = storage.append(key, value, value[split].repeat(2, 1))
+                        tensors[key] = storage.select(key, value, keep)
+                    else:
+                        tensors[key] = storage.recycle(key, value, split, torch.cat((value[clone], value[split].repeat(2, 1))))
+                synchronize(args.device)
+                seconds += (time.time() - start) / args.iters
+                peaks.append(peak_memory_mb(args.device))
+                del tensors, storage
+            report("N={} {}".format(num_points, name), seconds, max(peaks), unit="step")
+
+
+@torch.no_grad()
+def bench_storage(args):
+    # densify (grow by 10%) / prune (drop 5%) cycles of per-Gaussian tensors: torch.cat and masking vs CapacityStorage
+    for name in ["cat", "capacity"]:
+        tensors, storage = gaussian_tensors(args.num_points, args.device), CapacityStorage()
+
+        def cycle():
+            N = next(iter(tensors.values())).shape[0]
+            clone = torch.randint(0, N, (N // 10,), device=args.device)
+            keep = torch.rand(N + clone.shape[0], device=args.device) > 0.05
+            for key, value in tensors.items():
+                if name == "cat":
+                    tensors[key] = torch.cat((value, value[clone]))[keep]
+                else:
+                    tensors[key] = storage.select(key, storage.append(key, value, value[clone]), keep)
+
+        seconds, peak_mb = timeit(cycle, args.device, args.iters)
+        report(name, seconds, peak_mb, unit="cycle")
+        print("  {} Gaussians after {} cycles".format(next(iter(tensors.values())).shape[0], args.iters + 2))
+        del tensors, storage
+
+
+def bench_sparse_adam(args):
+    # optimizer step over the Gaussian parameters with --active_fraction of them visible: dense vs sparse Adam
+    for num_points in args.point_counts:
+        params = [torch.nn.Parameter(torch.randn((num_points, width), device=args.device)) for width in GAUSSIAN_WIDTHS.values()]
+        visibility = torch.rand(num_points, device=args.device) < args.active_fraction
+        for p in params:
+            p.grad = torch.randn_like(p) * visibility.view(-1, 1)
+        optimizers = [
+            ("dense", torch.optim.Adam(params, lr=1e-3, eps=1e-15), {}),
+            ("sparse", SparseAdam([{"params": params, "sparse": True}], lr=1e-3, eps=1e-15), {"visibility": visibility}),
+            ("sparse row bias", SparseAdam([{"params": params, "sparse": True, "row_bias_correction": True}], lr=1e-3, eps=1e-15),
+             {"visibility": visibility}),
+        ]
+        for name, optimizer, kwargs in optimizers:
+            seconds, peak_mb = timeit(lambda: optimizer.step(**kwargs), args.device, args.iters)
+            report("N={} {}".format(num_points, name), seconds, peak_mb, unit="step")
+            optimizer.state.clear()
+        del params, optimizers
+
+
+@torch.no_grad()
+def bench_morton(args):
+    # gather of the coefficients of the Gaussians inside a box covering --active_fraction of the scene
+    # (the rows a culled view touches): creation order vs Morton order
+    xyz = torch.rand((args.num_points, 3), device=args.device)
+    coefs = random_coefs(args.num_points, args.device)
+    side = args.active_fraction ** (1 / 3)
+    corners = torch.rand((args.iters + 2, 3), device=args.device) * (1 - side)
+    for name in ["creation order", "morton order"]:
+        if name == "morton order":
+            order = torch.argsort(morton_codes(xyz))
+            xyz, coefs = xyz[order], coefs[order]
+        views = [((xyz >= corner) & (xyz < corner + side)).all(-1).nonzero().squeeze(1) for corner in corners]
+        index = itertools.cycle(views)
+        seconds, peak_mb = timeit(lambda: coefs[next(index)], args.device, args.iters)
+        report(name, seconds, peak_mb)
+        print("  {:.1f}% of the Gaussians per view".format(100 * sum(v.shape[0] for v in views) / len(views) / args.num_points))
+
+
+def bench_sizing(args):
+    # predicted training memory with --dynamic_fraction of the Gaussians storing coefficients, no device work
+    hyper = Namespace(fused_deformation=True, motion_rank=args.motion_rank, motion_knots=64)
+    num_dynamic = int(args.dynamic_fraction * args.num_points)
+    for curve_num in args.curve_nums:
+        for name, basis_type in sorted(BASIS_TYPES.items()):
+            basis = basis_type(args.ch_num, curve_num, hyper)
+            print("{} basis, ch_num={}, curve_num={}, {} dynamic".format(name, args.ch_num, curve_num, num_dynamic))
+            print(format_memory_report(args.num_points, estimate_model_memory(
+                args.num_points, basis, args.sh_degree, num_dynamic=num_dynamic)))
+            if args.memory_budget_mb > 0:
+                print("  max Gaussians in {:.0f} MB: {}".format(
+                    args.memory_budget_mb, max_gaussians(args.memory_budget_mb * 2**20, basis, args.sh_degree)))
+
+
+def bench_mixed_precision(args):
+    # fit random target curves with each _coefs storage precision and compare the deformation error
+    hyper = Namespace(fused_deformation=True)
+    basis = BASIS_TYPES["gaussian"](CH_NUM, CURVE_NUM, hyper)
+    target = random_coefs(args.num_points, args.device).view(args.num_points, CH_NUM, 3, CURVE_NUM)
+    target[:, :, 2] = 0.05
+    times = torch.rand(args.iters, device=args.device).tolist()
+    eval_times = torch.linspace(0, 1, 50, device=args.device)
+    reference = batched_gaussian_deformation(target, eval_times, 1)
+    configs = [
+        ("float32", "float32", "master"),
+        ("bfloat16", "float32", "master"),
+        ("bfloat16", "bfloat16", "master"),
+        ("bfloat16", "float32", "stochastic"),
+        ("bfloat16", "bfloat16", "stochastic"),
+    ]
+    for coefs_dtype, state_dtype, rounding in configs:
+        init = basis.initial_coefs(args.num_points, 0.05).to(args.device)
+        coefs = torch.nn.Parameter(init.to(DTYPES[coefs_dtype]))
+        group = {"params": [coefs], "lr": 1e-3}
+        if coefs_dtype != "float32" or state_dtype != "float32":
+            group.update({"mixed_precision": True, "state_dtype": DTYPES[state_dtype], "rounding": rounding})
+        optimizer = MixedPrecisionAdam([group], eps=1e-15)
+        for t in times:
+            min_idx, max_idx = deformation_window(t, CURVE_NUM, GM_NUM)
+            out = windowed_gaussian_deformation(basis.view(coefs).float(), t, min_idx, max_idx)
+            loss = (out - windowed_gaussian_deformation(target, t, 0, CURVE_NUM)).abs().mean()
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+        with torch.no_grad():
+            error = (batched_gaussian_deformation(basis.view(coefs).float(), eval_times, 1) - reference).abs().mean().item()
+        sizes = estimate_model_memory(1, basis, 3, DTYPES[coefs_dtype], DTYPES[state_dtype], rounding == "master")
+        print("coefs {:<8s} state {:<8s} {:<10s} mean |deformation error| {:.3e}, coefs + optimizer {:>6d} B/Gaussian".format(
+            coefs_dtype, state_dtype, rounding, error, sizes["coefs"] + sizes["coefs_optimizer"]))
+
+
+BENCHMARKS = {
+    "deformation": bench_deformation,
+    "deform_batch": bench_deform_batch,
+    "sparse": bench_sparse,
+    "basis": bench_basis,
+    "sequential": bench_sequential,
+    "time_index": bench_time_index,
+    "checkpoint": bench_checkpoint,
+    "compile": bench_compile,
+    "storage": bench_storage,
+    "densify": bench_densify,
+    "sparse_adam": bench_sparse_adam,
+    "morton": bench_morton,
+    "sizing": bench_sizing,
+    "mixed_precision": bench_mixed_precision,
+}
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark script parameters")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS.keys()))
+    parser.add_argument("--num_points", type=int, default=1_000_000)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--backward", action="store_true")
+    parser.add_argument("--num_frames", type=int, default=300)
+    parser.add_argument("--memory_budget_mb", type=float, default=1024)
+    parser.add_argument("--topk", type=int, default=4)
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    parser.add_argument("--active_fraction", type=float, default=0.1)
+    parser.add_argument("--curve_nums", nargs="+", type=int, default=[20, 80, 320])
+    parser.add_argument("--ch_num", type=int, default=CH_NUM)
+    parser.add_argument("--sh_degree", type=int, default=3)
+    parser.add_argument("--motion_rank", type=int, default=16)
+    parser.add_argument("--dynamic_fraction", type=float, default=1.0)
+    parser.add_argument("--point_counts", nargs="+", type=int, default=[250_000, 500_000, 1_000_000])
+    args = parser.parse_args()
+    print("{} on {} with {} Gaussians".format(args.benchmark, args.device, args.num_points))
+    BENCHMARKS[args.benchmark](args)
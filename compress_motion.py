@@ -0,0 +1,47 @@
+#
+# Compress the deformation of a trained model into the low-rank motion basis.
+# Usage: python compress_motion.py -m output/endonerf/pulling_fdm --output_path output/endonerf/pulling_fdm_rank16 --motion_rank 16
+# Render the result with --deform_basis lowrank --motion_rank 16.
+#
+import os
+import torch
+from argparse import ArgumentParser, Namespace
+
+from arguments import ModelParams, FDMHiddenParams, get_combined_args
+from scene.flexible_deform_model import GaussianModel
+from utils.system_utils import searchForMaxIteration
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Motion compression script parameters")
+    model = ModelParams(parser, sentinel=True)
+    hyperparam = FDMHiddenParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--output_path", type=str, required=True)
+    parser.add_argument("--num_samples", type=int, default=100)
+    args = get_combined_args(parser)
+    dataset, hyper = model.extract(args), hyperparam.extract(args)
+    # the bank is a least squares fit of motion_knots control points to num_samples samples
+    assert args.num_samples >= hyper.motion_knots, \
+        "--num_samples ({}) must be at least --motion_knots ({})".format(args.num_samples, hyper.motion_knots)
+
+    iteration = args.iteration
+    if iteration == -1:
+        iteration = searchForMaxIteration(os.path.join(dataset.model_path, "point_cloud"))
+    iteration_path = os.path.join("point_cloud", "iteration_{}".format(iteration))
+    ply_path = os.path.join(iteration_path, "point_cloud.ply")
+
+    with torch.no_grad():
+        gaussians = GaussianModel(dataset.sh_degree, hyper)
+        gaussians.load_ply(os.path.join(dataset.model_path, ply_path))
+        # deformation_table.pth, save_ply writes it again next to the compressed model
+        gaussians.load_model(os.path.join(dataset.model_path, iteration_path))
+        before = gaussians._coefs.numel()
+        residual = gaussians.factorize_motion(hyper.motion_rank, args.num_samples)
+        print("rank {}: {:.2e} of the motion energy discarded, coefficients {} -> {}".format(
+            hyper.motion_rank, residual, before, gaussians._coefs.numel()))
+        gaussians.save_ply(os.path.join(args.output_path, ply_path))
+
+    cfg = vars(args).copy()
+    cfg.update(model_path=args.output_path, deform_basis="lowrank")
+    with open(os.path.join(args.output_path, "cfg_args"), 'w') as cfg_log_f:
+        cfg_log_f.write(str(Namespace(**cfg)))
@@ -15,11 +15,24 @@ from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianR
 from scene.flexible_deform_model import GaussianModel
 from utils.sh_utils import eval_sh
 
-def render_flow(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, override_color = None):
+def render_flow(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, override_color = None, deformed = None):
     """
     Render the scene. 
     
     Background tensor (bg_color) must be on GPU!
+    deformed: optional (xyz, scales, rotations) precomputed for this view by
+    GaussianModel.deform_batch, in which case the deformation is skipped.
+    Without it, no-grad renders go through pc.deformation_cache when enabled,
+    or read the baked deformation table when one is loaded.
+    With pipe.motion_culling, Gaussians whose motion bounds miss the view
+    frustum are dropped before deformation and rasterization. This only
+    applies to models that are not being trained: the bounds would have to
+    be rebuilt after every optimizer step.
+    |xyz offsets| only go to pc._deformation_accum while
+    pc.collect_deformation_stats is set (see sample_deformation_stats).
+    With pc.compile_deformation, the remaining renders assemble the
+    attributes with the compiled pc.render_attributes, except while
+    pc.collect_kernel_scores needs the gradient of the deformation.
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
@@ -70,34 +83,56 @@ def render_flow(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Ten
     else:
         scales = pc._scaling
         rotations = pc._rotation
-    deformation_point = pc._deformation_table
-    
-
-    means3D_deform, scales_deform, rotations_deform = pc.deformation(means3D[deformation_point], scales[deformation_point], 
-                                                                         rotations[deformation_point],
-                                                                         ori_time)
-    opacity_deform = opacity[deformation_point]
-        
-    # print(time.max())
-    with torch.no_grad():
-        pc._deformation_accum[deformation_point] += torch.abs(means3D_deform - means3D[deformation_point])
+    visible = None
+    if pipe.motion_culling and pc.optimizer is None:
+        visible = pc.motion_frustum_mask(viewpoint_camera, scaling_modifier).nonzero().squeeze(1)
+    if deformed is None and not torch.is_grad_enabled():
+        if pc.deformation_cache is not None:
+            deformed = pc.cached_deformation(viewpoint_camera.time)
+        elif pc.baked_deformation is not None:
+            xyz_baked, scales_baked, rotations_baked = pc.deform_batch([viewpoint_camera.time])
+            deformed = (xyz_baked[0], scales_baked[0], rotations_baked[0])
+    activated = False
+    if pc.compile_deformation and not pc.collect_kernel_scores and deformed is None and visible is None:
+        means3D_final, scales_final, rotations_final, opacity, deform_xyz = pc.render_attributes(ori_time)
+        activated = True
+        if pc.collect_deformation_stats:
+            pc.add_deformation_stats(deform_xyz)
+    elif deformed is not None:
+        means3D_final, scales_final, rotations_final = deformed
+        if visible is not None:
+            means3D_final, scales_final, rotations_final = means3D_final[visible], scales_final[visible], rotations_final[visible]
+    else:
+        # dynamic Gaussians are kept as the contiguous prefix [:n_dynamic]
+        n_dynamic = pc._num_dynamic
+        if visible is None:
+            dynamic, static, index = slice(None, n_dynamic), slice(n_dynamic, None), None
+            n_static = means3D.shape[0] - n_dynamic
+        else:
+            # visible is sorted, so its dynamic Gaussians come first
+            n_visible_dynamic = int((visible < n_dynamic).sum().item())
+            dynamic, static = visible[:n_visible_dynamic], visible[n_visible_dynamic:]
+            index = dynamic
+            n_static = static.shape[0]
+        means3D_deform, scales_deform, rotations_deform = pc.deformation(means3D[dynamic], scales[dynamic], 
+                                                                             rotations[dynamic],
+                                                                             ori_time, index)
+            
+        # print(time.max())
+        if pc.collect_deformation_stats:
+            pc.add_deformation_stats(torch.abs(means3D_deform.detach() - means3D[dynamic].detach()), index)
 
-    means3D_final = torch.zeros_like(means3D)
-    rotations_final = torch.zeros_like(rotations)
-    scales_final = torch.zeros_like(scales)
-    opacity_final = torch.zeros_like(opacity)
-    means3D_final[deformation_point] =  means3D_deform
-    rotations_final[deformation_point] =  rotations_deform
-    scales_final[deformation_point] =  scales_deform
-    opacity_final[deformation_point] = opacity_deform
-    means3D_final[~deformation_point] = means3D[~deformation_point]
-    rotations_final[~deformation_point] = rotations[~deformation_point]
-    scales_final[~deformation_point] = scales[~deformation_point]
-    opacity_final[~deformation_point] = opacity[~deformation_point]
+        if n_static == 0:
+            means3D_final, scales_final, rotations_final = means3D_deform, scales_deform, rotations_deform
+        else:
+            means3D_final = torch.cat((means3D_deform, means3D[static]))
+            rotations_final = torch.cat((rotations_deform, rotations[static]))
+            scales_final = torch.cat((scales_deform, scales[static]))
 
-    scales_final = pc.scaling_activation(scales_final)
-    rotations_final = pc.rotation_activation(rotations_final)
-    opacity = pc.opacity_activation(opacity)
+    if not activated:
+        scales_final = pc.scaling_activation(scales_final)
+        rotations_final = pc.rotation_activation(rotations_final)
+        opacity = pc.opacity_activation(opacity)
 
     # If precomputed colors are provided, use them. Otherwise, if it is desired to precompute colors
     # from SHs in Python, do it. If not, then SH -> RGB conversion will be done by rasterizer.
@@ -115,6 +150,13 @@ def render_flow(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Ten
     else:
         colors_precomp = override_color
 
+    if visible is not None:
+        means2D = means2D[visible]
+        opacity = opacity[visible]
+        shs = shs[visible] if shs is not None else None
+        colors_precomp = colors_precomp[visible] if colors_precomp is not None else None
+        cov3D_precomp = cov3D_precomp[visible] if cov3D_precomp is not None else None
+
     # Rasterize visible Gaussians to image, obtain their radii (on screen). 
     rendered_image, radii, depth = rasterizer(
         means3D = means3D_final,
@@ -125,6 +167,8 @@ def render_flow(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Ten
         scales = scales_final,
         rotations = rotations_final,
         cov3D_precomp = cov3D_precomp)
+    if visible is not None:
+        radii = torch.zeros(pc.get_xyz.shape[0], dtype=radii.dtype, device=radii.device).index_copy_(0, visible, radii)
 
     # Those Gaussians that were frustum culled or had a radius of 0 were not visible.
     # They will be excluded from value updates used in the splitting criteria.
@@ -29,6 +29,15 @@ import cv2
 
 to8b = lambda x : (255*np.clip(x.cpu().numpy(),0,1)).astype(np.uint8)
 
+def measure_fps(views, gaussians, pipeline, background, test_times):
+    for i in range(test_times):
+        for idx, view in enumerate(tqdm(views, desc="Rendering progress")):
+            if idx == 0 and i == 0:
+                time1 = time()
+            rendering = render(view, gaussians, pipeline, background)
+    time2=time()
+    return (len(views)-1)*test_times/(time2-time1)
+
 def render_set(model_path, name, iteration, views, gaussians, pipeline, background,\
     no_fine, render_test=False, reconstruct=False, crop_size=0):
     render_path = os.path.join(model_path, name, "ours_{}".format(iteration), "renders")
@@ -49,9 +58,15 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
     gt_depths = []
     mask_list = []
 
+    # deform whole blocks of the sequence at once instead of once per frame
+    block_size = gaussians.deform_batch_frames(pipeline.deform_batch_memory_mb)
     for idx, view in enumerate(tqdm(views, desc="Rendering progress")):
         stage = 'coarse' if no_fine else 'fine'
-        rendering = render(view, gaussians, pipeline, background)
+        if idx % block_size == 0:
+            block_times = [v.time for v in views[idx:idx+block_size]]
+            xyz_block, scales_block, rotations_block = gaussians.deform_batch(block_times, pipeline.deform_batch_memory_mb)
+        i = idx % block_size
+        rendering = render(view, gaussians, pipeline, background, deformed=(xyz_block[i], scales_block[i], rotations_block[i]))
         render_depths.append(rendering["depth"].cpu())
         render_images.append(rendering["render"].cpu())
         if name in ["train", "test", "video"]:
@@ -64,14 +79,18 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
     
     if render_test:
         test_times = 20
-        for i in range(test_times):
-            for idx, view in enumerate(tqdm(views, desc="Rendering progress")):
-                if idx == 0 and i == 0:
-                    time1 = time()
-                stage = 'coarse' if no_fine else 'fine'
-                rendering = render(view, gaussians, pipeline, background)
-        time2=time()
-        print("FPS:",(len(views)-1)*test_times/(time2-time1))
+        # the loop revisits the same frames, time the deformation instead of deformation cache hits
+        deformation_cache, gaussians.deformation_cache = gaussians.deformation_cache, None
+        print("FPS:", measure_fps(views, gaussians, pipeline, background, test_times))
+        gaussians.deformation_cache = deformation_cache
+        if deformation_cache is not None:
+            # and once more with the repeated frames served from the deformation cache
+            print("FPS with deformation cache:", measure_fps(views, gaussians, pipeline, background, test_times))
+            print("deformation cache:", deformation_cache.stats())
+    if gaussians.sequential_deformation is not None:
+        print("sequential playback:", gaussians.sequential_deformation.stats())
+    if gaussians.time_index is not None:
+        print("time index:", gaussians.time_index.stats())
     
     count = 0
     print("writing training images.")
@@ -128,10 +147,16 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
         print('file name:', name)
         reconstruct_point_cloud(render_images, mask_list, render_depths, camera_parameters, name, crop_size)
 
-def render_sets(dataset : ModelParams, hyperparam, iteration : int, pipeline : PipelineParams, skip_train : bool, skip_test : bool, skip_video: bool, reconstruct_train: bool, reconstruct_test: bool, reconstruct_video: bool):
+def render_sets(dataset : ModelParams, hyperparam, iteration : int, pipeline : PipelineParams, skip_train : bool, skip_test : bool, skip_video: bool, reconstruct_train: bool, reconstruct_test: bool, reconstruct_video: bool, bake_samples: int = 0):
     with torch.no_grad():
         gaussians = GaussianModel(dataset.sh_degree, hyperparam)
         scene = Scene(dataset, gaussians, load_iteration=iteration)
+        gaussians.enable_deformation_cache(pipeline.deform_cache_mb)
+        gaussians.enable_time_index(pipeline.time_index_tolerance)
+        if bake_samples > 0:
+            bake_path = os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(scene.loaded_iter), "deformation_bake.npy")
+            gaussians.bake_deformation(bake_path, bake_samples, pipeline.deform_batch_memory_mb)
+            gaussians.load_baked_deformation(bake_path)
 
         bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
         background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
@@ -141,6 +166,8 @@ def render_sets(dataset : ModelParams, hyperparam, iteration : int, pipeline : P
         if not skip_test:
             render_set(dataset.model_path, "test", scene.loaded_iter, scene.getTestCameras(), gaussians, pipeline, background, False, reconstruct=reconstruct_test, crop_size=20)
         if not skip_video:
+            # the video split is rendered in temporal order
+            gaussians.enable_sequential_playback(pipeline.sequential_tolerance)
             render_set(dataset.model_path,"video",scene.loaded_iter, scene.getVideoCameras(),gaussians,pipeline,background, False, render_test=True, reconstruct=reconstruct_video, crop_size=20)
 
 def reconstruct_point_cloud(images, masks, depths, camera_parameters, name, crop_left_size=0):
@@ -205,6 +232,7 @@ if __name__ == "__main__":
     parser.add_argument("--reconstruct_train", action="store_true")
     parser.add_argument("--reconstruct_test", action="store_true")
     parser.add_argument("--reconstruct_video", action="store_true")
+    parser.add_argument("--bake_samples", type=int, default=0)
     parser.add_argument("--configs", type=str)
     args = get_combined_args(parser)
     print("Rendering ", args.model_path)
@@ -218,4 +246,4 @@ if __name__ == "__main__":
     render_sets(model.extract(args), hyperparam.extract(args), args.iteration, 
         pipeline.extract(args), 
         args.skip_train, args.skip_test, args.skip_video,
-        args.reconstruct_train,args.reconstruct_test,args.reconstruct_video)
\ No newline at end of file
+        args.reconstruct_train,args.reconstruct_test,args.reconstruct_video, args.bake_samples)
\ No newline at end of file
@@ -0,0 +1,103 @@
+import torch
+
+
+class CapacityStorage:
+    """
+    Preallocated row storage for the per-Gaussian tensors of a GaussianModel.
+
+    Every tensor is handed out as the view [:N] of a buffer with room for
+    capacity >= N rows. Appending rows writes into the spare capacity (which
+    doubles when it runs out) and selecting rows compacts them into the
+    front of the same buffer, so densification and pruning do not allocate
+    new parameter, optimizer state or statistics tensors.
+    A tensor that is not the view of its buffer (e.g. Adam moments created
+    lazily by the optimizer, or statistics replaced by the training code) is
+    adopted into a new buffer the first time it is grown.
+    With max_rows, capacities are not grown past max_rows (unless a single
+    request needs more), e.g. to keep a Gaussian budget predictable.
+    """
+
+    def __init__(self, growth=2.0, max_rows=None):
+        self.growth = growth
+        self.max_rows = max_rows
+        self.buffers = {}
+
+    def _capacity(self, rows, grown):
+        if self.max_rows is not None:
+            grown = min(grown, self.max_rows)
+        return max(rows, grown)
+
+    def _owns(self, key, tensor):
+        buffer = self.buffers.get(key)
+        return buffer is not None and tensor.data_ptr() == buffer.data_ptr() and tensor.dtype == buffer.dtype \
+            and tensor.shape[1:] == buffer.shape[1:] and tensor.is_contiguous()
+
+    def _allocate(self, key, capacity, shape, dtype, device):
+        buffer = torch.empty((capacity,) + tuple(shape[1:]), dtype=dtype, device=device)
+        self.buffers[key] = buffer
+        return buffer
+
+    @torch.no_grad()
+    def append(self, key, tensor, extension):
+        # tensor followed by the rows of extension, as a view of the buffer of key
+        N, rows = tensor.shape[0], tensor.shape[0] + extension.shape[0]
+        owned = self._owns(key, tensor)
+        if owned and self.buffers[key].shape[0] >= rows:
+            buffer = self.buffers[key]
+        else:
+            capacity = self._capacity(rows, int(self.growth * (self.buffers[key].shape[0] if owned else N)))
+            buffer = self._allocate(key, capacity, tensor.shape, tensor.dtype, tensor.device)
+            buffer[:N].copy_(tensor)
+        buffer[N:rows].copy_(extension)
+        return buffer[:rows]
+
+    @torch.no_grad()
+    def select(self, key, tensor, index):
+        # tensor[index] (boolean mask or index tensor) compacted into the front of the buffer of key
+        rows = tensor[index]
+        if not self._owns(key, tensor):
+            # the tensor itself becomes the buffer, its rows are enough for any selection
+            self.buffers[key] = tensor.detach().contiguous()
+        buffer = self.buffers[key]
+        buffer[:rows.shape[0]].copy_(rows)
+        return buffer[:rows.shape[0]]
+
+    @torch.no_grad()
+    def assign(self, key, tensor, rows):
+        # rows replace tensor, written into the buffer of key when it has room for them
+        owned = self._owns(key, tensor)
+        if owned and self.buffers[key].shape[0] >= rows.shape[0]:
+            buffer = self.buffers[key]
+        else:
+            capacity = self._capacity(rows.shape[0], int(self.growth * rows.shape[0]))
+            buffer = self._allocate(key, capacity, rows.shape, rows.dtype, rows.device)
+        buffer[:rows.shape[0]].copy_(rows)
+        return buffer[:rows.shape[0]]
+
+    @torch.no_grad()
+    def recycle(self, key, tensor, free, rows):
+        # the first len(free) rows overwrite tensor[free] (an index tensor) in place, the others are appended
+        if not self._owns(key, tensor):
+            self.buffers[key] = tensor.detach().contiguous()
+            tensor = self.buffers[key][:tensor.shape[0]]
+        self.buffers[key].index_copy_(0, free, rows[:free.shape[0]])
+        return self.append(key, tensor, rows[free.shape[0]:])
+
+    @torch.no_grad()
+    def zeros(self, key, shape, dtype=torch.float32, device="cuda"):
+        # zero filled tensor of the given shape, reusing the buffer of key when it is large enough
+        buffer = self.buffers.get(key)
+        if buffer is None or buffer.dtype != dtype or buffer.shape[1:] != tuple(shape[1:]):
+            buffer = self._allocate(key, shape[0], shape, dtype, device)
+        elif buffer.shape[0] < shape[0]:
+            buffer = self._allocate(key, self._capacity(shape[0], int(self.growth * buffer.shape[0])), shape, dtype, device)
+        view = buffer[:shape[0]]
+        view.zero_()
+        return view
+
+    def release(self, key):
+        # drop the buffer of key, e.g. after its tensor was replaced by one of a different layout
+        self.buffers.pop(key, None)
+
+    def nbytes(self):
+        return sum(buffer.numel() * buffer.element_size() for buffer in self.buffers.values())
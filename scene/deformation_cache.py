@@ -0,0 +1,74 @@
+from collections import OrderedDict
+
+
+class DeformationCache:
+    """
+    LRU cache of deformed Gaussian states keyed by quantized time.
+
+    Timestamps closer than 1/resolution share an entry. The cache is emptied
+    whenever the state token passed to validate() changes, i.e. when the
+    Gaussian parameters were replaced or updated in place.
+    """
+
+    def __init__(self, max_bytes, resolution=10000):
+        self.max_bytes = max_bytes
+        self.resolution = resolution
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._token = None
+
+    def key(self, time):
+        return int(round(float(time) * self.resolution))
+
+    def validate(self, token):
+        if token != self._token:
+            if self.entries:
+                self.invalidations += 1
+            self.clear()
+            self._token = token
+
+    def get(self, key):
+        entry = self.entries.get(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, tensors):
+        nbytes = self._entry_bytes(tensors)
+        if nbytes > self.max_bytes:
+            return
+        if key in self.entries:
+            self.nbytes -= self._entry_bytes(self.entries.pop(key))
+        while self.entries and self.nbytes + nbytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= self._entry_bytes(evicted)
+            self.evictions += 1
+        self.entries[key] = tensors
+        self.nbytes += nbytes
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    @staticmethod
+    def _entry_bytes(tensors):
+        return sum(t.numel() * t.element_size() for t in tensors)
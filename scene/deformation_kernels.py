@@ -0,0 +1,274 @@
+import math
+
+import torch
+
+
+def deformation_window(t, curve_num, gm_num):
+    # Active kernel range [min_idx, max_idx) around time t. Kernels outside
+    # the window still contribute to the deformation but receive no gradient.
+    idx = int(math.floor(float(t) * curve_num)) + 2
+    if gm_num > 0:
+        min_idx = max(idx - gm_num, 0)
+        max_idx = min(idx + gm_num, curve_num)
+    else:
+        min_idx = 0
+        max_idx = curve_num
+    return min_idx, max_idx
+
+
+def _gaussian_basis(coefs, t):
+    # exp(-((t-mu)^2/(sigma^2+eps))^2) * weight, evaluated with in-place ops so
+    # that only two temporaries of the size of one coefficient slice are alive.
+    weight, mu, sigma = coefs.unbind(-2)
+    denom = sigma * sigma
+    denom.add_(1e-6)
+    out = torch.sub(t, mu)
+    out.square_().div_(denom)
+    del denom
+    out.square_().neg_().exp_().mul_(weight)
+    return out
+
+
+class WindowedGaussianDeformation(torch.autograd.Function):
+    """
+    Sum of Gaussian kernels over the last dimension of coefs [N, CH, 3, C].
+    The forward pass keeps no intermediates; backward recomputes the kernels
+    of the active window only and leaves the gradient of all other kernels at 0.
+    """
+
+    @staticmethod
+    def forward(ctx, coefs, t, min_idx, max_idx):
+        with torch.no_grad():
+            contrib = _gaussian_basis(coefs, t)
+            # same summation order as the split based reference path
+            deform = contrib[..., :min_idx].sum(-1)
+            deform += contrib[..., min_idx:max_idx].sum(-1)
+            deform += contrib[..., max_idx:].sum(-1)
+        ctx.save_for_backward(coefs, t)
+        ctx.window = (min_idx, max_idx)
+        return deform
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        coefs, t = ctx.saved_tensors
+        min_idx, max_idx = ctx.window
+        grad_coefs = torch.zeros_like(coefs)
+        if max_idx <= min_idx:
+            return grad_coefs, None, None, None
+
+        weight, mu, sigma = coefs[..., min_idx:max_idx].unbind(-2)
+        grad_weight, grad_mu, grad_sigma = grad_coefs[..., min_idx:max_idx].unbind(-2)
+        denom = sigma * sigma + 1e-6
+        diff = t - mu
+        exponent = diff * diff / denom
+        gaussian = torch.exp(-exponent * exponent)
+        grad = grad_output.unsqueeze(-1)
+
+        grad_weight.copy_(gaussian * grad)
+        # d/d(exponent) of weight * exp(-exponent^2)
+        common = gaussian.mul_(weight).mul_(exponent).mul_(grad).mul_(-2.0)
+        grad_mu.copy_(common * diff * -2.0 / denom)
+        grad_sigma.copy_(common * exponent * sigma * -2.0 / denom)
+        return grad_coefs, None, None, None
+
+
+def windowed_gaussian_deformation(coefs, t, min_idx, max_idx):
+    """
+    Fused evaluation of the Gaussian basis deformation.
+
+    coefs: [N, CH, 3, C] view of the deformation coefficients (weight, mu, sigma).
+    t: scalar time, python float or 0-dim tensor.
+    Returns the per-channel deformation [N, CH].
+    """
+    t = torch.as_tensor(t, dtype=coefs.dtype, device=coefs.device)
+    return WindowedGaussianDeformation.apply(coefs, t, min_idx, max_idx)
+
+
+def windowed_gaussian_deformation_reference(coefs, t, min_idx, max_idx):
+    # Plain autograd version, kept as the numerical reference for the fused kernel.
+    curve_num = coefs.shape[-1]
+    coefs = torch.split(coefs, [min_idx, max_idx-min_idx, curve_num-max_idx], -1)
+    deform = 0
+    for i, coef in enumerate(coefs):
+        if i != 1:
+            coef = coef.clone().detach()
+        weight, mu, sigma = torch.chunk(coef, 3, -2)
+        exponent = (t - mu)**2/(sigma**2+1e-6)
+        gaussian = torch.exp(-exponent**2)
+        deform += (gaussian*weight).sum(-1).squeeze(-1)
+    return deform
+
+
+def static_window_gaussian_deformation(coefs, t, gm_num):
+    """
+    Same result as windowed_gaussian_deformation for the window of
+    deformation_window, but the window is a mask computed from the time
+    tensor t: no host sync and no shapes that depend on t, so the function
+    can be captured by torch.compile / CUDA graphs.
+    """
+    curve_num = coefs.shape[-1]
+    weight, mu, sigma = coefs.unbind(-2)
+    exponent = (t - mu)**2/(sigma**2+1e-6)
+    contrib = torch.exp(-exponent**2)*weight
+    if gm_num <= 0:
+        return contrib.sum(-1)
+    kernel = torch.arange(curve_num, device=coefs.device)
+    idx = torch.floor(t * curve_num).long() + 2
+    window = (kernel >= idx - gm_num) & (kernel < idx + gm_num)
+    return torch.where(window, contrib, contrib.detach()).sum(-1)
+
+
+@torch.no_grad()
+def batched_gaussian_deformation(coefs, times, frames_per_chunk):
+    """
+    Gaussian basis deformation for several timestamps at once.
+
+    coefs: [N, CH, 3, C], times: [T]. Kernels are evaluated for
+    frames_per_chunk timestamps at a time to bound the [T', N, CH, C]
+    temporary. Returns [T, N, CH].
+    """
+    N, ch_num = coefs.shape[:2]
+    times = times.to(device=coefs.device, dtype=coefs.dtype)
+    deform = coefs.new_empty((times.shape[0], N, ch_num))
+    for start in range(0, times.shape[0], frames_per_chunk):
+        chunk = times[start:start+frames_per_chunk]
+        contrib = _gaussian_basis(coefs, chunk.view(-1, 1, 1, 1))
+        torch.sum(contrib, -1, out=deform[start:start+chunk.shape[0]])
+        del contrib
+    return deform
+
+
+def topk_kernel_index(coefs, k):
+    # indices [N, CH, k] of the k kernels with the largest |weight| per Gaussian and channel
+    return coefs[:, :, 0].abs().topk(k, dim=-1, sorted=False).indices
+
+
+def kernel_index_dtype(curve_num):
+    # smallest integer type that holds the kernel indices of a packed model
+    return torch.uint8 if curve_num <= 256 else torch.int16
+
+
+def gather_kernels(coefs, index):
+    # packed [N, CH, 3, k] (weight, mu, sigma) of the kernels selected by index [N, CH, k]
+    return torch.gather(coefs, -1, index.long().unsqueeze(2).expand(-1, -1, 3, -1))
+
+
+def sparse_gaussian_deformation(coefs, t):
+    """
+    Gaussian basis deformation of packed kernels coefs [N, CH, 3, k] (see
+    gather_kernels). Only the k packed kernels are evaluated, and all of
+    them receive gradients. Returns [N, CH].
+    """
+    return windowed_gaussian_deformation(coefs, t, 0, coefs.shape[-1])
+
+
+# max |d/dx exp(-x^4)|, attained at x^4 = 3/4
+GAUSSIAN_LIPSCHITZ = 4 * 0.75**0.75 * math.exp(-0.75)
+
+
+def gaussian_kernel_support(weight, sigma, tolerance):
+    # half-width around mu beyond which |weight| * exp(-x^4) < tolerance (0 for |weight| <= tolerance)
+    width = torch.sqrt(sigma * sigma + 1e-6)
+    return width * torch.log(torch.clamp(weight.abs() / tolerance, min=1)).pow(0.25)
+
+
+@torch.no_grad()
+def gaussian_activity_intervals(coefs, tolerance):
+    """
+    Per-Gaussian time interval [start, end] outside of which every kernel of
+    coefs [N, CH, 3, C] contributes less than tolerance, i.e. the deformation
+    of each channel is below C * tolerance. Gaussians without any kernel
+    above tolerance get the empty interval [inf, -inf].
+    """
+    weight, mu, sigma = coefs.unbind(-2)
+    support = gaussian_kernel_support(weight, sigma, tolerance)
+    active = weight.abs() > tolerance
+    start = torch.where(active, mu - support, torch.full_like(mu, math.inf)).flatten(1).min(-1).values
+    end = torch.where(active, mu + support, torch.full_like(mu, -math.inf)).flatten(1).max(-1).values
+    return start, end
+
+
+class IncrementalGaussianDeformation:
+    """
+    Gaussian basis deformation for temporally coherent playback.
+
+    The contribution of every kernel is kept together with a time interval
+    in which it is guaranteed to change by at most tolerance: either by the
+    Lipschitz bound |weight| * L / sigma * |t - t_k|, or because t stays on
+    the same side of a kernel outside its support (|weight| * exp(-x^4) <
+    tolerance). Each frame only re-evaluates the kernels whose interval no
+    longer contains t and adds their change to the deformation, so the error
+    of a channel is at most C * tolerance. The state takes four floats per
+    kernel (contribution, evaluation time and interval).
+    """
+
+    def __init__(self, coefs, tolerance):
+        # kernels are read from the flat coefficients, (weight, mu, sigma) of kernel k of row r at r*3C + k + (0, C, 2C)
+        self.coefs = coefs.contiguous()
+        self.tolerance = tolerance
+        N, ch_num, _, curve_num = coefs.shape
+        self.deform = coefs.new_zeros((N, ch_num))
+        self.contrib = coefs.new_zeros((N, ch_num, curve_num))
+        self.eval_time = coefs.new_zeros((N, ch_num, curve_num))
+        self.lower = coefs.new_full((N, ch_num, curve_num), math.inf)
+        self.upper = coefs.new_full((N, ch_num, curve_num), -math.inf)
+        self.evaluated = 0
+        self.total = 0
+
+    @torch.no_grad()
+    def __call__(self, t):
+        t = float(t)
+        stale = ((self.lower > t) | (self.upper < t)).view(-1).nonzero().squeeze(1)
+        if stale.numel() > 0:
+            curve_num = self.contrib.shape[-1]
+            rows = torch.div(stale, curve_num, rounding_mode="floor")
+            offset = rows * 3 * curve_num + stale % curve_num
+            coefs = self.coefs.view(-1)
+            weight, mu, sigma = coefs[offset], coefs[offset + curve_num], coefs[offset + 2 * curve_num]
+            denom = sigma * sigma + 1e-6
+            exponent = (t - mu)**2 / denom
+            contrib = torch.exp(-exponent**2) * weight
+            self.deform.view(-1).index_add_(0, rows, contrib - self.contrib.view(-1)[stale])
+            self.contrib.view(-1)[stale] = contrib
+            self.eval_time.view(-1)[stale] = t
+            lipschitz = GAUSSIAN_LIPSCHITZ * weight.abs() / torch.sqrt(denom)
+            lower, upper = self._valid_interval(mu, lipschitz, gaussian_kernel_support(weight, sigma, self.tolerance), t)
+            self.lower.view(-1)[stale] = lower
+            self.upper.view(-1)[stale] = upper
+        self.evaluated += stale.numel()
+        self.total += self.contrib.numel()
+        return self.deform
+
+    def _valid_interval(self, mu, lipschitz, support, t):
+        # per kernel interval around t with a change below tolerance
+        radius = self.tolerance / lipschitz
+        lower = t - radius
+        upper = t + radius
+        right = t > mu + support
+        left = t < mu - support
+        lower = torch.where(right, torch.minimum(lower, mu + support), lower)
+        upper = torch.where(right, torch.full_like(upper, math.inf), upper)
+        lower = torch.where(left, torch.full_like(lower, -math.inf), lower)
+        upper = torch.where(left, torch.maximum(upper, mu - support), upper)
+        return lower, upper
+
+    @torch.no_grad()
+    def error_bound(self, t):
+        # per-channel bound [N, CH] on |incremental - exact| at time t
+        t = float(t)
+        weight, mu, sigma = self.coefs.unbind(-2)
+        lipschitz = GAUSSIAN_LIPSCHITZ * weight.abs() / torch.sqrt(sigma * sigma + 1e-6)
+        support = gaussian_kernel_support(weight, sigma, self.tolerance)
+        t_k = self.eval_time
+        same_side_outside = ((t - mu >= support) & (t_k - mu >= support)) | \
+                            ((t - mu <= -support) & (t_k - mu <= -support))
+        bound = torch.abs(t_k - t) * lipschitz
+        bound = torch.where(same_side_outside, torch.clamp(bound, max=self.tolerance), bound)
+        return bound.sum(-1)
+
+    def stats(self):
+        return {
+            "evaluated_kernels": self.evaluated,
+            "total_kernels": self.total,
+            "evaluated_fraction": self.evaluated / self.total if self.total else 0.0,
+        }
@@ -0,0 +1,63 @@
+class DensificationScheduler:
+    """
+    Decides at every densification and pruning interval of the training
+    loop whether the pass is worth reallocating the per-Gaussian tensors.
+
+    A densification pass runs while at least min_candidate_fraction of the
+    Gaussians have an average view-space gradient above the threshold.
+    Densification stops for good once the passes added less than
+    converged_growth of the Gaussians (skipped passes add none) `patience`
+    times in a row. A pruning pass runs when it removes at least
+    min_prune_fraction of the Gaussians.
+    Decisions are queued in `decisions` until the training loop logs them.
+    """
+
+    def __init__(self, min_candidate_fraction, converged_growth, patience, min_prune_fraction):
+        self.min_candidate_fraction = min_candidate_fraction
+        self.converged_growth = converged_growth
+        self.patience = patience
+        self.min_prune_fraction = min_prune_fraction
+        self.stable_passes = 0
+        self.converged = False
+        self.decisions = []
+
+    def densify(self, candidate_fraction):
+        # run the densification pass?
+        if self.converged:
+            # the training loop no longer collects gradients, candidate_fraction is stale
+            self.decisions.append({"pass": "densify", "decision": "stop"})
+            return False
+        decision = "skip" if candidate_fraction < self.min_candidate_fraction else "run"
+        self.decisions.append({"pass": "densify", "decision": decision, "candidate_fraction": candidate_fraction})
+        if decision == "skip":
+            self.grown(0.0)
+        return decision == "run"
+
+    def grown(self, growth):
+        # fraction of Gaussians added by the last densification pass
+        self.stable_passes = self.stable_passes + 1 if growth < self.converged_growth else 0
+        self.converged = self.stable_passes >= self.patience
+        self.decisions[-1].update({"growth": growth, "converged": self.converged})
+
+    def prune(self, prune_fraction):
+        # run the pruning pass?
+        decision = "run" if prune_fraction >= self.min_prune_fraction else "skip"
+        self.decisions.append({"pass": "prune", "decision": decision, "prune_fraction": prune_fraction})
+        return decision == "run"
+
+    def pop_decisions(self):
+        decisions, self.decisions = self.decisions, []
+        return decisions
+
+
+def format_decision(decision):
+    line = "{} {}".format(decision["pass"], decision["decision"])
+    if "candidate_fraction" in decision:
+        line += ": {:.2%} candidates".format(decision["candidate_fraction"])
+    if "growth" in decision:
+        line += ", {:+.2%} Gaussians".format(decision["growth"])
+    if "prune_fraction" in decision:
+        line += ": {:.2%} to prune".format(decision["prune_fraction"])
+    if decision.get("converged", False):
+        line += ", converged"
+    return line
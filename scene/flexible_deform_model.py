@@ -11,17 +11,29 @@
 
 import torch
 import numpy as np
+from torch.utils.checkpoint import checkpoint
 from utils.general_utils import inverse_sigmoid, get_expon_lr_func, build_rotation
 from torch import nn
 import os
+import copy
 from utils.system_utils import mkdir_p
 from plyfile import PlyData, PlyElement
 from random import randint
 from utils.sh_utils import RGB2SH, SH2RGB
 from simple_knn._C import distCUDA2
-from utils.graphics_utils import BasicPointCloud, getWorld2View2
+from utils.graphics_utils import BasicPointCloud, getWorld2View2, frustum_planes, aabb_in_frustum, morton_codes
 from utils.general_utils import strip_symmetric, build_scaling_rotation
 from scene.regulation import compute_plane_smoothness
+from scene.deformation_cache import DeformationCache
+from scene.deformation_kernels import topk_kernel_index, kernel_index_dtype, gather_kernels, sparse_gaussian_deformation, \
+    static_window_gaussian_deformation, IncrementalGaussianDeformation, gaussian_activity_intervals
+from scene.time_index import TimeIntervalIndex
+from scene.temporal_basis import BASIS_TYPES, LowRankBasis
+from scene.model_sizing import estimate_model_memory, format_memory_report
+from scene.mixed_precision import DTYPES, ROUNDING_MODES, MixedPrecisionAdam
+from scene.sparse_adam import SparseAdam
+from scene.capacity_storage import CapacityStorage
+from scene.densification_scheduler import DensificationScheduler
 from typing import Tuple
 
 import cv2
@@ -38,8 +50,15 @@ INTERVAL = 0.05
 MAX_NUM = int(SAVE_TIME/INTERVAL)
 GAUSSIAN_NUM = 10
 FOURIER_ORDER_NUM = 10
-CH_NUM = 13
-CURVE_NUM = 20
+# channel layout of the deformation coefficients
+DEFORM_CHANNELS = {
+    "xyz": slice(0, 3),
+    "rotation": slice(3, 7),
+    "scaling": slice(7, 10),
+    "brightness": slice(10, 13),
+}
+# channels consumed by the renderer; the brightness channels are never applied
+GEOMETRY_CHANNELS = slice(0, 10)
     
 class GaussianModel:
 
@@ -82,9 +101,57 @@ class GaussianModel:
         self.ply_input = None
         self.args = args
         
-        self.gm_num = 8
-        self.ch_num = CH_NUM
+        self.deformation_cache = None
+        self.baked_deformation = None
+        self.sequential_deformation = None
+        self.time_index = None
+        self._motion_bounds = None
+        self.sparse_topk = args.sparse_topk
+        # training evaluates all kernels until its first sparsify_deformation, see training_setup
+        self.sparse_warmup = False
+        self.deformation_checkpoint = args.deformation_checkpoint
+        self.compile_deformation = args.compile_deformation
+        self.compile_mode = args.compile_mode
+        # the recomputation in backward would replay the CUDA graph over outputs the forward pass still holds
+        assert not (self.compile_deformation and self.deformation_checkpoint and self.compile_mode == "reduce-overhead"), \
+            "deformation_checkpoint needs compile_mode default with compile_deformation"
+        self._render_attributes_fn = None
+        # renders only add to _deformation_accum while this is set, see sample_deformation_stats
+        self.collect_deformation_stats = False
+        self.deformation_stats_interval = 0
+        self.deformation_stats_fraction = 1.0
+        self.densification_scheduler = None
+        # in sparse mode _coefs holds the packed (weight, mu, sigma) of sparse_topk kernels per channel, _sparse_index their kernel index
+        self._sparse_index = None
+        # accumulated gradient of every kernel at zero weight, the regrowth score of sparsify_deformation
+        self._kernel_scores = None
+        self.collect_kernel_scores = False
+        self.sparsify_interval = 0
+        self.sparse_score_iters = 0
+        self.sparse_regrow_fraction = 0.0
+        self._num_dynamic = 0
+        # _coefs only holds rows for the dynamic Gaussians, row i belongs to Gaussian i of the dynamic prefix;
+        # between densification and partition_deformation_table, _coefs_index maps every Gaussian to its row (-1: static)
+        self._coefs_index = None
+        self.morton_sort = False
+        # per-Gaussian parameters, optimizer state and statistics grow and shrink inside preallocated buffers
+        self._storage = CapacityStorage()
+        # coefficients are only allocated for channels the renderer consumes
+        assert args.ch_num >= GEOMETRY_CHANNELS.stop, "ch_num must cover the {} geometry channels".format(GEOMETRY_CHANNELS.stop)
+        self.ch_num = min(args.ch_num, GEOMETRY_CHANNELS.stop)
+        self.curve_num = args.curve_num
         self.fs_num = FOURIER_ORDER_NUM
+        # the fourier basis has fs_num harmonics per channel instead of curve_num kernels
+        self.basis = BASIS_TYPES[args.deform_basis](self.ch_num, self.fs_num if args.deform_basis == "fourier" else self.curve_num, args).to("cuda")
+        assert self.sparse_topk == 0 or self.basis.name == "gaussian", "sparse_topk requires the gaussian deformation basis"
+        # storage precision of _coefs and of its Adam moments; deformation is evaluated in fp32
+        self.coefs_dtype = DTYPES[args.coefs_dtype]
+        self.coefs_state_dtype = DTYPES[args.coefs_state_dtype]
+        self.coefs_rounding = args.coefs_rounding
+        assert self.coefs_rounding in ROUNDING_MODES, "coefs_rounding must be one of {}".format(ROUNDING_MODES)
+        # without loss scaling, float16 coefficient gradients and the squared gradients in the moments underflow
+        assert self.coefs_dtype != torch.float16, "coefs_dtype must be float32 or bfloat16"
+        assert self.coefs_state_dtype != torch.float16, "coefs_state_dtype must be float32 or bfloat16"
         
         self.save_coef_path = None
 
@@ -116,19 +183,25 @@ class GaussianModel:
         
 
     def capture(self):
+        # per-Gaussian tensors are [:N] views of the capacity buffers, torch.save would write the whole buffers
+        def copy(tensor):
+            return nn.Parameter(tensor.detach().clone()) if isinstance(tensor, nn.Parameter) else tensor.clone()
+        optimizer_state = self.optimizer.state_dict()
+        optimizer_state["state"] = {idx: {key: value.clone() for key, value in state.items()}
+                                    for idx, state in optimizer_state["state"].items()}
         return (
             self.active_sh_degree,
-            self._xyz,
-            self._deformation_table,
-            self._features_dc,
-            self._features_rest,
-            self._scaling,
-            self._rotation,
-            self._opacity,
-            self.max_radii2D,
-            self.xyz_gradient_accum,
-            self.denom,
-            self.optimizer.state_dict(),
+            copy(self._xyz),
+            copy(self._deformation_table),
+            copy(self._features_dc),
+            copy(self._features_rest),
+            copy(self._scaling),
+            copy(self._rotation),
+            copy(self._opacity),
+            copy(self.max_radii2D),
+            copy(self.xyz_gradient_accum),
+            copy(self.denom),
+            optimizer_state,
             self.percent_dense,
             self.spatial_lr_scale,
         )
@@ -215,10 +288,7 @@ class GaussianModel:
 
         
         N = fused_point_cloud.shape[0]
-        weight_coefs = torch.zeros((N, CH_NUM, CURVE_NUM))
-        position_coefs = torch.zeros((N, CH_NUM, CURVE_NUM)) + torch.linspace(0,1,CURVE_NUM)
-        shape_coefs = torch.zeros((N, CH_NUM, CURVE_NUM)) + self.args.init_param
-        _coefs = torch.stack((weight_coefs, position_coefs, shape_coefs), dim=2).reshape(N,-1).float().to("cuda")
+        _coefs = self.basis.initial_coefs(N, self.args.init_param).to(device="cuda", dtype=self.coefs_dtype)
         self._coefs = nn.Parameter(_coefs.requires_grad_(True))
         
         opacities = inverse_sigmoid(0.1 * torch.ones((fused_point_cloud.shape[0], 1), dtype=torch.float, device="cuda"))
@@ -231,13 +301,33 @@ class GaussianModel:
         self._opacity = nn.Parameter(opacities.requires_grad_(True))
         self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
         self._deformation_table = torch.gt(torch.ones((self.get_xyz.shape[0]),device="cuda"),0)
+        self._num_dynamic = self.get_xyz.shape[0]
 
     def training_setup(self, training_args):
         #training_args = self.config['opt_params']
         self.percent_dense = training_args.percent_dense
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self._deformation_accum = torch.zeros((self.get_xyz.shape[0],3),device="cuda")
+        self.xyz_gradient_accum = self._storage.zeros("xyz_gradient_accum", (self.get_xyz.shape[0], 1))
+        self.denom = self._storage.zeros("denom", (self.get_xyz.shape[0], 1))
+        self._deformation_accum = self._storage.zeros("deformation_accum", (self.get_xyz.shape[0], 3))
+        self.deformation_stats_interval = training_args.deformation_stats_interval
+        self.deformation_stats_fraction = training_args.deformation_stats_fraction
+        assert 0 < self.deformation_stats_fraction <= 1, "deformation_stats_fraction must be in (0, 1]"
+        assert training_args.deformation_table_threshold == 0 or self.deformation_stats_interval > 0, \
+            "deformation_table_threshold needs the deformation statistics (deformation_stats_interval > 0)"
+        self.morton_sort = training_args.morton_sort
+        # top-k kernels picked from the initial (all zero) weights would be arbitrary
+        self.sparse_warmup = self.sparse_topk > 0 and self._sparse_index is None
+        self.sparsify_interval = training_args.sparsify_interval
+        self.sparse_score_iters = training_args.sparse_score_iters
+        self.sparse_regrow_fraction = training_args.sparse_regrow_fraction
+        self.max_gaussians = training_args.max_gaussians
+        self.max_gaussians_evict_fraction = training_args.max_gaussians_evict_fraction
+        if self.max_gaussians > 0:
+            self._storage.max_rows = self.max_gaussians
+        if training_args.adaptive_densification:
+            self.densification_scheduler = DensificationScheduler(
+                training_args.densify_min_candidate_fraction, training_args.densify_converged_growth,
+                training_args.densify_patience, training_args.prune_min_fraction)
         
         l = [
             {'params': [self._xyz], 'lr': training_args.position_lr_init * self.spatial_lr_scale, "name": "xyz"},
@@ -248,8 +338,26 @@ class GaussianModel:
             {'params': [self._rotation], 'lr': training_args.rotation_lr, "name": "rotation"},
             {'params': [self._coefs], 'lr': training_args.deformation_lr_init * self.spatial_lr_scale, "name": "coefs"}
         ]
-
-        self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
+        mixed_precision = self.coefs_dtype != torch.float32 or self.coefs_state_dtype != torch.float32
+        if mixed_precision:
+            l[-1].update({"mixed_precision": True, "state_dtype": self.coefs_state_dtype, "rounding": self.coefs_rounding})
+        # only the visible Gaussians are updated, reduced precision coefficients keep the dense mixed precision step
+        self.sparse_adam = training_args.sparse_adam
+        if self.sparse_adam:
+            for group in l:
+                if not group.get("mixed_precision", False):
+                    group.update({"sparse": True, "row_bias_correction": training_args.sparse_adam_row_bias_correction,
+                                  "prefix": group["name"] == "coefs"})
+        # parameters shared by all Gaussians (e.g. the low-rank motion bank) are never pruned or extended
+        if self.basis.parameters():
+            l.append({'params': self.basis.parameters(), 'lr': training_args.deformation_lr_init * self.spatial_lr_scale, "name": "deformation"})
+
+        if self.sparse_adam:
+            self.optimizer = SparseAdam(l, lr=0.0, eps=1e-15)
+        elif mixed_precision:
+            self.optimizer = MixedPrecisionAdam(l, lr=0.0, eps=1e-15)
+        else:
+            self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
         
         self.xyz_scheduler_args = get_expon_lr_func(lr_init=training_args.position_lr_init*self.spatial_lr_scale,
                                                     lr_final=training_args.position_lr_final*self.spatial_lr_scale,
@@ -291,6 +399,9 @@ class GaussianModel:
             l.append('rot_{}'.format(i))
         for i in range(self._coefs.shape[1]):
             l.append('coefs_{}'.format(i))
+        if self._sparse_index is not None:
+            for i in range(self._sparse_index[0].numel()):
+                l.append('kidx_{}'.format(i))
         return l
 
     def load_model(self, path):
@@ -305,32 +416,43 @@ class GaussianModel:
         if os.path.exists(os.path.join(path, "deformation_accum.pth")):
             self._deformation_accum = torch.load(os.path.join(path, "deformation_accum.pth"), map_location="cuda")
 
-        # Load main model data (from new code)
-        state_dict = torch.load(path)
-        new_xyz = state_dict['xyz']
-        new_features_dc = state_dict['feature_dc']
-        new_features_rest = state_dict['feature_rest']
-        new_opacity = state_dict['opacity']
-        new_scaling = state_dict['scaling']
-        new_rotation = state_dict['rotation']
-        new_coefs = state_dict['coef']
-        new_unique_kfIDs = state_dict['unique_kfIDs']
-        new_n_obs = state_dict['n_obs']
-    
-        self.start_time = state_dict['start_time']
-        self.max_time = state_dict['max_time']
-    
-        self.densification_postfix(
-            new_xyz,
-            new_features_dc,
-            new_features_rest,
-            new_opacity,
-            new_scaling,
-            new_rotation,
-            new_coefs=new_coefs,
-            new_kf_ids=new_unique_kfIDs,
-            new_n_obs=new_n_obs,
-        )
+        # Load main model data (from new code); Scene passes the iteration folder, whose Gaussians come from load_ply
+        if os.path.isfile(path):
+            state_dict = torch.load(path)
+            self.start_time = state_dict['start_time']
+            self.max_time = state_dict['max_time']
+            deformation_table = self._deformation_table
+            self._set_points(state_dict['xyz'], state_dict['feature_dc'], state_dict['feature_rest'], state_dict['opacity'],
+                             state_dict['scaling'], state_dict['rotation'], state_dict['coef'], state_dict.get('sparse_index'))
+            self._deformation_table = deformation_table
+            self.unique_kfIDs = state_dict['unique_kfIDs']
+            self.n_obs = state_dict['n_obs']
+        assert self._deformation_table.shape[0] == self.get_xyz.shape[0], "deformation table does not match the loaded Gaussians"
+        self.partition_deformation_table()
+
+    def _set_points(self, xyz, features_dc, features_rest, opacity, scaling, rotation, coefs, sparse_index=None):
+        # replace all Gaussians, e.g. when loading a trained model, and reset the per-Gaussian buffers
+        # (with sparse_index, coefs are packed kernels)
+        self._xyz = nn.Parameter(xyz.detach().float().cuda().requires_grad_(True))
+        self._features_dc = nn.Parameter(features_dc.detach().float().cuda().requires_grad_(True))
+        self._features_rest = nn.Parameter(features_rest.detach().float().cuda().requires_grad_(True))
+        self._opacity = nn.Parameter(opacity.detach().float().cuda().requires_grad_(True))
+        self._scaling = nn.Parameter(scaling.detach().float().cuda().requires_grad_(True))
+        self._rotation = nn.Parameter(rotation.detach().float().cuda().requires_grad_(True))
+        self._coefs = nn.Parameter(coefs.detach().cuda().to(self.coefs_dtype).requires_grad_(True))
+        N = self._xyz.shape[0]
+        self.max_radii2D = torch.zeros((N), device="cuda")
+        self.xyz_gradient_accum = torch.zeros((N, 1), device="cuda")
+        self.denom = torch.zeros((N, 1), device="cuda")
+        self._deformation_accum = torch.zeros((N, 3), device="cuda")
+        self._deformation_table = torch.ones((N), dtype=torch.bool, device="cuda")
+        self._num_dynamic = N
+        self._coefs_index = None
+        self._sparse_index = None
+        self._kernel_scores = None
+        if sparse_index is not None:
+            self._sparse_index = sparse_index.cuda().to(kernel_index_dtype(self.basis.curve_num))
+            self.sparse_topk = self._sparse_index.shape[-1]
 
     def save_model(self, path):
         mkdir_p(os.path.dirname(path))
@@ -341,7 +463,8 @@ class GaussianModel:
             'opacity': self._opacity,
             'scaling': self._scaling,
             'rotation': self._rotation,
-            'coef': self._coefs,
+            'coef': self._gaussian_coefs(slice(None)),
+            'sparse_index': None if self._sparse_index is None else self._gaussian_sparse_index(slice(None)),
             'unique_kfIDs': self.unique_kfIDs,
             'n_obs': self.n_obs,
             'deform': self.deform,
@@ -408,49 +531,43 @@ class GaussianModel:
         coefs = np.zeros((xyz.shape[0], len(coef_names)))
         for idx, attr_name in enumerate(coef_names):
             coefs[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        # Convert to tensors and set up parameters
-        new_xyz = torch.tensor(xyz, dtype=torch.float, device="cuda")
-        new_features_dc = nn.Parameter(
-            torch.tensor(features_dc, dtype=torch.float, device="cuda")
-            .transpose(1, 2)
-            .contiguous()
-            .requires_grad_(True)
-        )
-        new_features_rest = nn.Parameter(
-            torch.tensor(features_extra, dtype=torch.float, device="cuda")
-            .transpose(1, 2)
-            .contiguous()
-            .requires_grad_(True)
-        )
-        new_opacity = nn.Parameter(
-            torch.tensor(opacities, dtype=torch.float, device="cuda").requires_grad_(True)
-        )
-        new_scaling = nn.Parameter(
-            torch.tensor(scales, dtype=torch.float, device="cuda").requires_grad_(True)
-        )
-        new_rotation = nn.Parameter(
-            torch.tensor(rots, dtype=torch.float, device="cuda").requires_grad_(True)
-        )
-        new_coefs = nn.Parameter(
-            torch.tensor(coefs, dtype=torch.float, device="cuda").requires_grad_(True)
-        )
-    
-        self.max_radii2D = torch.zeros((new_xyz.shape[0]), device="cuda")
-        new_unique_kfIDs = torch.zeros((new_xyz.shape[0]))
-        new_n_obs = torch.zeros((new_xyz.shape[0]), device="cpu").int()
-    
-        self.densification_postfix(
-            new_xyz,
-            new_features_dc,
-            new_features_rest,
-            new_opacity,
-            new_scaling,
-            new_rotation,
-            new_coefs=new_coefs,
-            new_kf_ids=new_unique_kfIDs,
-            new_n_obs=new_n_obs,
+        # sparse models store the packed kernels and their kernel index
+        kidx_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("kidx_")]
+        kidx_names = sorted(kidx_names, key=lambda x: int(x.split('_')[-1]))
+        sparse_index = None
+        if kidx_names:
+            sparse_index = np.stack([np.asarray(plydata.elements[0][attr_name]) for attr_name in kidx_names], axis=1)
+            sparse_index = torch.tensor(sparse_index.astype(np.int64)).view(xyz.shape[0], self.ch_num, -1)
+            assert len(coef_names) == 3 * sparse_index[0].numel(), \
+                "{} stores {} packed coefficients for {} kernel indices".format(path, len(coef_names), len(kidx_names))
+        else:
+            coefs_per_channel = self.basis.coefs_per_channel
+            # older models also stored the brightness channels
+            assert len(coef_names) in (self.ch_num * coefs_per_channel, DEFORM_CHANNELS["brightness"].stop * coefs_per_channel), \
+                "{} stores {} deformation coefficients per Gaussian, expected {} channels x {} for the {} basis with curve_num={}".format(
+                    path, len(coef_names), self.ch_num, coefs_per_channel, self.basis.name, self.basis.curve_num)
+            # drop channels that are not allocated any more (e.g. brightness in older models)
+            coefs = coefs.reshape(xyz.shape[0], -1, coefs_per_channel)[:, :self.ch_num].reshape(xyz.shape[0], -1)
+
+        self._set_points(
+            torch.tensor(xyz, dtype=torch.float),
+            torch.tensor(features_dc, dtype=torch.float).transpose(1, 2).contiguous(),
+            torch.tensor(features_extra, dtype=torch.float).transpose(1, 2).contiguous(),
+            torch.tensor(opacities, dtype=torch.float),
+            torch.tensor(scales, dtype=torch.float),
+            torch.tensor(rots, dtype=torch.float),
+            torch.tensor(coefs, dtype=torch.float),
+            sparse_index,
         )
+        self.unique_kfIDs = torch.zeros((xyz.shape[0]))
+        self.n_obs = torch.zeros((xyz.shape[0]), device="cpu").int()
+        self.active_sh_degree = self.max_sh_degree
+        if self.basis.parameters():
+            basis_path = os.path.join(os.path.dirname(path), "temporal_basis.pth")
+            assert os.path.exists(basis_path), "the {} basis needs its shared parameters in {}".format(self.basis.name, basis_path)
+            for param, value in zip(self.basis.parameters(), torch.load(basis_path)):
+                assert param.shape == value.shape, "{} does not match the configured {} basis".format(basis_path, self.basis.name)
+                param.data = value.to(param.device)
 
     def save_ply(self, path):
         mkdir_p(os.path.dirname(path))
@@ -476,18 +593,33 @@ class GaussianModel:
         opacities = self._opacity.detach().cpu().numpy()
         scale = self._scaling.detach().cpu().numpy()
         rotation = self._rotation.detach().cpu().numpy()
-        coefs = self._coefs.detach().cpu().numpy()
+        # static Gaussians are written with motionless coefficients, deformation_table.pth marks them for load_model
+        coefs = self._gaussian_coefs(slice(None)).float().cpu().numpy()
+        # sparse models are written packed, with the kernel index of every coefficient triple
+        kidx = np.zeros((xyz.shape[0], 0))
+        kidx_type = "u1"
+        if self._sparse_index is not None:
+            kidx = self._gaussian_sparse_index(slice(None)).flatten(1).cpu().numpy()
+            kidx_type = "u1" if self._sparse_index.dtype == torch.uint8 else "i2"
 
         dtype_full = [
-            (attribute, "f4") for attribute in self.construct_list_of_attributes()
+            (attribute, kidx_type if attribute.startswith("kidx_") else "f4") for attribute in self.construct_list_of_attributes()
         ]
         elements = np.empty(xyz.shape[0], dtype=dtype_full)
         attributes = np.concatenate(
-            (xyz, normals, f_dc, f_rest, opacities, scale, rotation, coefs), axis=1
+            (xyz, normals, f_dc, f_rest, opacities, scale, rotation, coefs, kidx), axis=1
         )
+        deformation_table = self._deformation_table
+        if self.morton_sort:
+            # the file is written in Morton order, the Gaussians being trained keep theirs
+            order = self._spatial_order()
+            attributes, deformation_table = attributes[order.cpu().numpy()], deformation_table[order]
         elements[:] = list(map(tuple, attributes))
         el = PlyElement.describe(elements, "vertex")
         PlyData([el]).write(path)
+        torch.save(deformation_table, os.path.join(os.path.dirname(path), "deformation_table.pth"))
+        if self.basis.parameters():
+            torch.save([p.detach().cpu() for p in self.basis.parameters()], os.path.join(os.path.dirname(path), "temporal_basis.pth"))
 
 
     def reset_opacity(self):
@@ -513,24 +645,44 @@ class GaussianModel:
     def _prune_optimizer(self, mask):
         optimizable_tensors = {}
         for group in self.optimizer.param_groups:
-            if len(group["params"]) > 1:
+            # _coefs rows follow the dynamic Gaussians, see _select_coefs
+            if len(group["params"]) > 1 or group["name"] in ('deformation', 'coefs'):
                 continue
             stored_state = self.optimizer.state.get(group['params'][0], None)
             if stored_state is not None:
-                stored_state["exp_avg"] = stored_state["exp_avg"][mask]
-                stored_state["exp_avg_sq"] = stored_state["exp_avg_sq"][mask]
+                # exp_avg, exp_avg_sq and the fp32 master weights of mixed precision groups
+                for key, value in stored_state.items():
+                    if key != "step":
+                        stored_state[key] = self._storage.select(group["name"] + "." + key, value, mask)
                 del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter((group["params"][0][mask].requires_grad_(True)))
+                group["params"][0] = nn.Parameter(self._storage.select(group["name"], group["params"][0], mask).requires_grad_(True))
                 self.optimizer.state[group['params'][0]] = stored_state
                 optimizable_tensors[group["name"]] = group["params"][0]
             else:
-                group["params"][0] = nn.Parameter(group["params"][0][mask].requires_grad_(True))
+                group["params"][0] = nn.Parameter(self._storage.select(group["name"], group["params"][0], mask).requires_grad_(True))
                 optimizable_tensors[group["name"]] = group["params"][0]
         return optimizable_tensors
 
     def prune_points(self, mask):
         valid_points_mask = ~mask
-        optimizable_tensors = self._prune_optimizer(valid_points_mask)
+        self._select_points(valid_points_mask)
+
+    def _select_points(self, index):
+        # keep the Gaussians selected by a boolean mask or an index tensor, in index order
+        coefs_index = self._coefs_rows()[index]
+        if self.optimizer is not None:
+            optimizable_tensors = self._prune_optimizer(index)
+        else:
+            points = {
+                "xyz": self._xyz,
+                "f_dc": self._features_dc,
+                "f_rest": self._features_rest,
+                "opacity": self._opacity,
+                "scaling": self._scaling,
+                "rotation": self._rotation,
+            }
+            optimizable_tensors = {name: nn.Parameter(self._storage.select(name, tensor, index).requires_grad_(True))
+                                   for name, tensor in points.items()}
 
         self._xyz = optimizable_tensors["xyz"]
         self._features_dc = optimizable_tensors["f_dc"]
@@ -538,47 +690,189 @@ class GaussianModel:
         self._opacity = optimizable_tensors["opacity"]
         self._scaling = optimizable_tensors["scaling"]
         self._rotation = optimizable_tensors["rotation"]
-        self._coefs = optimizable_tensors["coefs"]
-        self._deformation_accum = self._deformation_accum[valid_points_mask]
-        self.xyz_gradient_accum = self.xyz_gradient_accum[valid_points_mask]
-        self._deformation_table = self._deformation_table[valid_points_mask]
-        self.denom = self.denom[valid_points_mask]
-        self.max_radii2D = self.max_radii2D[valid_points_mask]
+        if self.optimizer is not None:
+            self._deformation_accum = self._storage.select("deformation_accum", self._deformation_accum, index)
+            self.xyz_gradient_accum = self._storage.select("xyz_gradient_accum", self.xyz_gradient_accum, index)
+            self.denom = self._storage.select("denom", self.denom, index)
+        else:
+            self._deformation_accum = self._storage.zeros("deformation_accum", (self.get_xyz.shape[0], 3))
+        self._deformation_table = self._storage.select("deformation_table", self._deformation_table, index)
+        self.max_radii2D = self._storage.select("max_radii2D", self.max_radii2D, index)
+        num_dynamic = int(self._deformation_table.sum().item())
+        if self._deformation_table[:num_dynamic].all():
+            # dynamic Gaussians form a prefix again, compact _coefs to it
+            self._select_coefs(coefs_index[:num_dynamic])
+            self._num_dynamic = num_dynamic
+        else:
+            self._coefs_index = coefs_index
+
+    def _coefs_rows(self):
+        # _coefs row of every Gaussian, -1 for the static ones
+        if self._coefs_index is not None:
+            return self._coefs_index
+        rows = torch.arange(self._xyz.shape[0], device=self._deformation_table.device)
+        rows[self._num_dynamic:] = -1
+        return rows
+
+    def _gaussian_rows(self, tensor, index, initial):
+        # rows of tensor (one per _coefs row) for the Gaussians index, initial(n) rows for the static ones
+        rows = self._coefs_rows()[index]
+        selected = initial(rows.shape[0]).to(tensor.device, tensor.dtype)
+        dynamic = rows >= 0
+        selected[dynamic] = tensor.detach()[rows[dynamic]]
+        return selected
+
+    def _gaussian_coefs(self, index):
+        # coefficients of the Gaussians index, the initial (motionless) ones for static Gaussians
+        return self._gaussian_rows(self._coefs, index, self._initial_coefs)
+
+    def _gaussian_sparse_index(self, index):
+        # kernel index of the packed coefficients of the Gaussians index
+        return self._gaussian_rows(self._sparse_index, index, self._initial_sparse_index)
+
+    def _initial_coefs(self, n):
+        # n rows of initial (motionless) coefficients, packed to the kernels of _initial_sparse_index in sparse mode
+        coefs = self.basis.initial_coefs(n, self.args.init_param).to(self._coefs.device)
+        if self._sparse_index is not None:
+            coefs = gather_kernels(self.basis.view(coefs), self._initial_sparse_index(n)).flatten(1)
+        return coefs
+
+    def _initial_sparse_index(self, n):
+        # sparse_topk kernels spread evenly over the sequence
+        kernels = torch.linspace(0, self.basis.curve_num - 1, self.sparse_topk, device=self._sparse_index.device).round()
+        return kernels.to(self._sparse_index.dtype).expand(n, self.ch_num, -1).clone()
+
+    def _coefs_view(self, coefs):
+        # structured view of _coefs rows: the basis layout, [N, CH, 3, k] packed kernels in sparse mode
+        if self._sparse_index is not None:
+            return coefs.view(coefs.shape[0], self.ch_num, 3, -1)
+        return self.basis.view(coefs)
 
-    def cat_tensors_to_optimizer(self, tensors_dict):
+    @torch.no_grad()
+    def _select_coefs(self, rows):
+        """
+        Replace _coefs (and its optimizer state) by its rows `rows`, which
+        become the coefficients of the dynamic prefix. Rows of -1 belong to
+        Gaussians promoted from static: they start from the initial
+        coefficients with zero moments. Rows not selected (demoted or pruned
+        Gaussians) are dropped. The kernel index and scores of sparse mode
+        follow the same rows.
+        """
+        dynamic = rows >= 0
+        initial = self._initial_coefs(rows.shape[0])
+
+        def select(key, tensor, fill):
+            selected = fill.to(tensor.dtype)
+            selected[dynamic] = tensor.detach()[rows[dynamic]]
+            return self._storage.assign(key, tensor, selected)
+
+        coefs = nn.Parameter(select("coefs", self._coefs, initial).requires_grad_(True))
+        if self.optimizer is not None:
+            for group in self.optimizer.param_groups:
+                if group["name"] != "coefs":
+                    continue
+                stored_state = self.optimizer.state.pop(group['params'][0], None)
+                if stored_state is not None:
+                    for key, value in stored_state.items():
+                        if key != "step":
+                            fill = initial if key == "master" else value.new_zeros((rows.shape[0],) + value.shape[1:])
+                            stored_state[key] = select("coefs." + key, value, fill)
+                    self.optimizer.state[coefs] = stored_state
+                group["params"][0] = coefs
+        self._coefs = coefs
+        if self._sparse_index is not None:
+            self._sparse_index = select("sparse_index", self._sparse_index, self._initial_sparse_index(rows.shape[0]))
+        if self._kernel_scores is not None:
+            self._kernel_scores = select("kernel_scores", self._kernel_scores,
+                                         self._kernel_scores.new_zeros((rows.shape[0],) + self._kernel_scores.shape[1:]))
+        self._coefs_index = None
+
+    @torch.no_grad()
+    def partition_deformation_table(self):
+        """
+        Reorder the Gaussians (parameters, optimizer state and statistics) so
+        that the dynamic ones in _deformation_table form the contiguous prefix
+        [:_num_dynamic]. Deformation then runs on a view of that prefix, and
+        _coefs is compacted to one row per dynamic Gaussian.
+        """
+        table = self._deformation_table
+        num_dynamic = int(table.sum().item())
+        if not table[:num_dynamic].all():
+            order = torch.cat((table.nonzero().squeeze(1), (~table).nonzero().squeeze(1)))
+            self._select_points(order)
+        elif self._coefs_index is not None or num_dynamic != self._num_dynamic:
+            self._select_coefs(self._coefs_rows()[:num_dynamic])
+        self._num_dynamic = num_dynamic
+
+    @torch.no_grad()
+    def sort_spatially(self):
+        """
+        Reorder the Gaussians (parameters, optimizer state and statistics) by
+        the Morton code of _xyz, separately within the dynamic prefix and the
+        static rest, so that neighbouring Gaussians are close in memory.
+        """
+        self._select_points(self._spatial_order())
+
+    def _spatial_order(self):
+        # Morton order of the Gaussians within the dynamic prefix and within the static rest
+        n_dynamic = self._num_dynamic
+        codes = morton_codes(self._xyz.detach())
+        return torch.cat((torch.argsort(codes[:n_dynamic]), n_dynamic + torch.argsort(codes[n_dynamic:])))
+
+    def cat_tensors_to_optimizer(self, tensors_dict, free=None):
+        # with free, the first len(free) rows of the extensions overwrite the Gaussians free instead of being appended
+        if free is None:
+            extend = self._storage.append
+        else:
+            extend = lambda key, tensor, extension: self._storage.recycle(key, tensor, free, extension)
         optimizable_tensors = {}
         for group in self.optimizer.param_groups:
             if len(group["params"])>1 or group["name"]=='deformation':
                 continue
             assert len(group["params"]) == 1
             extension_tensor = tensors_dict[group["name"]]
+            # the coefficients of new dynamic Gaussians are always appended, _coefs_index maps them
+            extend_group = self._storage.append if group["name"] == "coefs" else extend
             stored_state = self.optimizer.state.get(group['params'][0], None)
             if stored_state is not None:
-                stored_state["exp_avg"] = torch.cat((stored_state["exp_avg"], torch.zeros_like(extension_tensor)), dim=0)
-                stored_state["exp_avg_sq"] = torch.cat((stored_state["exp_avg_sq"], torch.zeros_like(extension_tensor)), dim=0)
+                for key, value in stored_state.items():
+                    if key == "master":
+                        stored_state[key] = extend_group(group["name"] + "." + key, value, extension_tensor.detach().to(value.dtype))
+                    elif key != "step":
+                        # moments have the shape of the parameter, per-Gaussian counters (row_step) one value per row
+                        stored_state[key] = extend_group(group["name"] + "." + key, value, value.new_zeros((extension_tensor.shape[0],) + value.shape[1:]))
 
                 del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
+                group["params"][0] = nn.Parameter(extend_group(group["name"], group["params"][0], extension_tensor).requires_grad_(True))
                 self.optimizer.state[group['params'][0]] = stored_state
 
                 optimizable_tensors[group["name"]] = group["params"][0]
             else:
-                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
+                group["params"][0] = nn.Parameter(extend_group(group["name"], group["params"][0], extension_tensor).requires_grad_(True))
                 optimizable_tensors[group["name"]] = group["params"][0]
 
         return optimizable_tensors
 
-    def densification_postfix(self, new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation, new_coefs, new_deformation_table):
+    def densification_postfix(self, new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation, new_coefs, new_deformation_table, free=None,
+                              new_sparse_index=None):
         d = {"xyz": new_xyz,
         "f_dc": new_features_dc,
         "f_rest": new_features_rest,
         "opacity": new_opacities,
         "scaling" : new_scaling,
         "rotation" : new_rotation,
-        "coefs": new_coefs
+        "coefs": new_coefs[new_deformation_table]
        }
+        # rows of the new dynamic Gaussians are appended to _coefs
+        new_rows = torch.full((new_deformation_table.shape[0],), -1, dtype=torch.long, device=new_deformation_table.device)
+        new_rows[new_deformation_table] = self._coefs.shape[0] + torch.arange(d["coefs"].shape[0], device=new_rows.device)
+        coefs_index = self._coefs_rows()
+        if free is None:
+            coefs_index = torch.cat((coefs_index, new_rows))
+        else:
+            coefs_index = torch.cat((coefs_index.index_copy(0, free, new_rows[:free.shape[0]]), new_rows[free.shape[0]:]))
 
-        optimizable_tensors = self.cat_tensors_to_optimizer(d)
+        optimizable_tensors = self.cat_tensors_to_optimizer(d, free)
         self._xyz = optimizable_tensors["xyz"]
         self._features_dc = optimizable_tensors["f_dc"]
         self._features_rest = optimizable_tensors["f_rest"]
@@ -587,56 +881,101 @@ class GaussianModel:
         self._rotation = optimizable_tensors["rotation"]
         self._coefs = optimizable_tensors["coefs"]
         
-        self._deformation_table = torch.cat([self._deformation_table,new_deformation_table],-1)
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self._deformation_accum = torch.zeros((self.get_xyz.shape[0], 3), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
-
-    def densify_and_split(self, grads, grad_threshold, scene_extent, N=2):
-        n_init_points = self.get_xyz.shape[0]
-        # Extract points that satisfy the gradient condition
-        padded_grad = torch.zeros((n_init_points), device="cuda")
-        padded_grad[:grads.shape[0]] = grads.squeeze()
-        selected_pts_mask = torch.where(padded_grad >= grad_threshold, True, False)
-        selected_pts_mask = torch.logical_and(selected_pts_mask,
-                                              torch.max(self.get_scaling, dim=1).values > self.percent_dense*scene_extent)
+        if free is None:
+            self._deformation_table = self._storage.append("deformation_table", self._deformation_table, new_deformation_table)
+        else:
+            self._deformation_table = self._storage.recycle("deformation_table", self._deformation_table, free, new_deformation_table)
+        if self._sparse_index is not None:
+            self._sparse_index = self._storage.append("sparse_index", self._sparse_index, new_sparse_index[new_deformation_table])
+        if self._kernel_scores is not None:
+            self._kernel_scores = self._storage.append("kernel_scores", self._kernel_scores, self._kernel_scores.new_zeros(
+                (d["coefs"].shape[0],) + self._kernel_scores.shape[1:]))
+        self.reset_densification_stats()
+        self._coefs_index = coefs_index
+
+    def reset_densification_stats(self):
+        # the statistics of the next densification interval start from zero
+        self.xyz_gradient_accum = self._storage.zeros("xyz_gradient_accum", (self.get_xyz.shape[0], 1))
+        self._deformation_accum = self._storage.zeros("deformation_accum", (self.get_xyz.shape[0], 3))
+        self.denom = self._storage.zeros("denom", (self.get_xyz.shape[0], 1))
+        self.max_radii2D = self._storage.zeros("max_radii2D", (self.get_xyz.shape[0],))
+
+    def densify_and_clone_split(self, grads, grad_threshold, scene_extent, N=2):
+        """
+        Clone the small and split the large Gaussians whose gradient reaches
+        grad_threshold in a single update: the clones and the N samples of
+        every split Gaussian are built in one batch, the first new rows take
+        the slots of the split Gaussians and the others are appended, so
+        parameters and optimizer state are written once. Returns the number
+        of Gaussians added.
+        """
+        selected_pts_mask = torch.norm(grads, dim=-1) >= grad_threshold
+        large = torch.max(self.get_scaling, dim=1).values > self.percent_dense*scene_extent
+        clone_mask = torch.logical_and(selected_pts_mask, ~large)
+        split_mask = torch.logical_and(selected_pts_mask, large)
         if not selected_pts_mask.any():
-            return
-        stds = self.get_scaling[selected_pts_mask].repeat(N,1)
+            # densification_postfix is not reached, the statistics of the next interval still start from zero
+            self.reset_densification_stats()
+            return 0
+        stds = self.get_scaling[split_mask].repeat(N,1)
         means = torch.zeros((stds.size(0), 3),device="cuda")
         samples = torch.normal(mean=means, std=stds)
-        rots = build_rotation(self._rotation[selected_pts_mask]).repeat(N,1,1)
-        new_xyz = torch.bmm(rots, samples.unsqueeze(-1)).squeeze(-1) + self.get_xyz[selected_pts_mask].repeat(N, 1)
-        new_scaling = self.scaling_inverse_activation(self.get_scaling[selected_pts_mask].repeat(N,1) / (0.8*N))
-        new_rotation = self._rotation[selected_pts_mask].repeat(N,1)
-        new_features_dc = self._features_dc[selected_pts_mask].repeat(N,1,1)
-        new_features_rest = self._features_rest[selected_pts_mask].repeat(N,1,1)
-        new_opacity = self._opacity[selected_pts_mask].repeat(N,1)
-        new_coefs = self._coefs[selected_pts_mask].repeat(N,1)
-        new_deformation_table = self._deformation_table[selected_pts_mask].repeat(N)
-        self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacity, new_scaling, new_rotation, new_coefs,new_deformation_table)
-
-        prune_filter = torch.cat((selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device="cuda", dtype=bool)))
-        self.prune_points(prune_filter)
-
-    def densify_and_clone(self, grads, grad_threshold, scene_extent):
-        # Extract points that satisfy the gradient condition
-        selected_pts_mask = torch.where(torch.norm(grads, dim=-1) >= grad_threshold, True, False)
-        selected_pts_mask = torch.logical_and(selected_pts_mask,
-                                              torch.max(self.get_scaling, dim=1).values <= self.percent_dense*scene_extent)
-        
-        new_xyz = self._xyz[selected_pts_mask] 
-        new_features_dc = self._features_dc[selected_pts_mask]
-        new_features_rest = self._features_rest[selected_pts_mask]
-        new_opacities = self._opacity[selected_pts_mask]
-        new_scaling = self._scaling[selected_pts_mask]
-        new_rotation = self._rotation[selected_pts_mask]
-        new_coefs    = self._coefs[selected_pts_mask]
-        new_deformation_table = self._deformation_table[selected_pts_mask]
-
-        self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation,new_coefs, new_deformation_table)
-    
+        rots = build_rotation(self._rotation[split_mask]).repeat(N,1,1)
+        split_xyz = torch.bmm(rots, samples.unsqueeze(-1)).squeeze(-1) + self.get_xyz[split_mask].repeat(N, 1)
+        split_scaling = self.scaling_inverse_activation(self.get_scaling[split_mask].repeat(N,1) / (0.8*N))
+
+        new_xyz = torch.cat((self._xyz[clone_mask], split_xyz))
+        new_features_dc = torch.cat((self._features_dc[clone_mask], self._features_dc[split_mask].repeat(N,1,1)))
+        new_features_rest = torch.cat((self._features_rest[clone_mask], self._features_rest[split_mask].repeat(N,1,1)))
+        new_opacities = torch.cat((self._opacity[clone_mask], self._opacity[split_mask].repeat(N,1)))
+        new_scaling = torch.cat((self._scaling[clone_mask], split_scaling))
+        new_rotation = torch.cat((self._rotation[clone_mask], self._rotation[split_mask].repeat(N,1)))
+        new_coefs = torch.cat((self._gaussian_coefs(clone_mask), self._gaussian_coefs(split_mask).repeat(N,1)))
+        new_deformation_table = torch.cat((self._deformation_table[clone_mask], self._deformation_table[split_mask].repeat(N)))
+        new_sparse_index = None
+        if self._sparse_index is not None:
+            new_sparse_index = torch.cat((self._gaussian_sparse_index(clone_mask), self._gaussian_sparse_index(split_mask).repeat(N,1,1)))
+        free = split_mask.nonzero().squeeze(1)
+        self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation, new_coefs,
+                                   new_deformation_table, free=free, new_sparse_index=new_sparse_index)
+        return new_xyz.shape[0] - free.shape[0]
+
+    @torch.no_grad()
+    def budget_densification(self, grads, grad_threshold, scene_extent, N=2):
+        """
+        Keep densify_and_clone_split within max_gaussians. If its candidates
+        would exceed the budget, up to max_gaussians_evict_fraction of it is
+        freed by pruning the non-candidates of lowest importance (opacity x
+        max screen radius x visibility count since the last densification),
+        then only the candidates with the largest accumulated gradient that
+        still fit are kept. Returns grads for the remaining Gaussians with
+        the rejected candidates zeroed.
+        """
+        candidates = torch.norm(grads, dim=-1) >= grad_threshold
+        large = torch.max(self.get_scaling, dim=1).values > self.percent_dense*scene_extent
+        # a clone adds one Gaussian, a split replaces one by N
+        cost = torch.where(large, N - 1, 1) * candidates
+        growth = int(cost.sum().item())
+        free = self.max_gaussians - self.get_xyz.shape[0]
+        if growth <= free:
+            return grads
+
+        evict = min(growth - free, int(self.max_gaussians_evict_fraction * self.max_gaussians), int((~candidates).sum().item()))
+        if evict > 0:
+            importance = self.get_opacity.squeeze(-1) * self.max_radii2D * self.denom.squeeze(-1)
+            importance[candidates] = float("inf")
+            prune_mask = torch.zeros_like(candidates)
+            prune_mask[torch.topk(importance, evict, largest=False).indices] = True
+            self.prune_points(prune_mask)
+            grads, candidates, cost = grads[~prune_mask], candidates[~prune_mask], cost[~prune_mask]
+            free += evict
+
+        order = torch.argsort(torch.norm(grads, dim=-1), descending=True)
+        rejected = order[torch.cumsum(cost[order], 0) > max(free, 0)]
+        grads = grads.clone()
+        grads[rejected] = 0.0
+        return grads
+
     def prune(self, max_grad, min_opacity, extent, max_screen_size):
         prune_mask = (self.get_opacity < min_opacity).squeeze()
         if max_screen_size:
@@ -644,15 +983,30 @@ class GaussianModel:
             # big_points_ws = self.get_scaling.max(dim=1).values > 0.1 * extent
             prune_mask = torch.logical_or(prune_mask, big_points_vs)
             # prune_mask = torch.logical_or(torch.logical_or(prune_mask, big_points_vs), big_points_ws)
+        scheduler = self.densification_scheduler
+        if scheduler is not None and not scheduler.prune(prune_mask.float().mean().item()):
+            return
         self.prune_points(prune_mask)
-        torch.cuda.empty_cache()
+        self.partition_deformation_table()
 
     def densify(self, max_grad, min_opacity, extent, max_screen_size):
         grads = self.xyz_gradient_accum / self.denom
         grads[grads.isnan()] = 0.0
-
-        self.densify_and_clone(grads, max_grad, extent)
-        self.densify_and_split(grads, max_grad, extent)
+        scheduler = self.densification_scheduler
+        if scheduler is not None and not scheduler.densify((torch.norm(grads, dim=-1) >= max_grad).float().mean().item()):
+            # like a pass that densifies nothing, the next one reads the statistics of its own interval
+            self.reset_densification_stats()
+            return
+        num_points = self.get_xyz.shape[0]
+        if self.max_gaussians > 0:
+            grads = self.budget_densification(grads, max_grad, extent)
+
+        added = self.densify_and_clone_split(grads, max_grad, extent)
+        if scheduler is not None:
+            scheduler.grown(added / num_points)
+        self.partition_deformation_table()
+        if self.morton_sort:
+            self.sort_spatially()
     
     def standard_constaint(self):
         means3D = self._xyz.detach()
@@ -671,47 +1025,460 @@ class GaussianModel:
         self.xyz_gradient_accum[update_filter] += torch.norm(viewspace_point_tensor[update_filter,:2], dim=-1, keepdim=True)
         self.denom[update_filter] += 1
 
+    def sample_deformation_stats(self, iteration):
+        # collect _deformation_accum in the renders of this iteration?
+        interval = self.deformation_stats_interval
+        self.collect_deformation_stats = interval > 0 and iteration % interval == 0
+
     @torch.no_grad()
-    def update_deformation_table(self,threshold):
+    def add_deformation_stats(self, deform_xyz, index=None):
+        """
+        Accumulate the |xyz offset| deform_xyz of the dynamic Gaussians index
+        (the dynamic prefix if None) into _deformation_accum, on a random
+        deformation_stats_fraction of them. Samples are scaled by
+        interval / fraction, so the accumulator stays an unbiased estimate
+        of the per-iteration sum read by update_deformation_table.
+        """
+        fraction = self.deformation_stats_fraction
+        if fraction < 1:
+            sample = (torch.rand(deform_xyz.shape[0], device=deform_xyz.device) < fraction).nonzero().squeeze(1)
+            index = sample if index is None else index[sample]
+            deform_xyz = deform_xyz[sample]
+        scale = self.deformation_stats_interval / fraction
+        if index is None:
+            self._deformation_accum[:deform_xyz.shape[0]] += scale * deform_xyz
+        else:
+            self._deformation_accum.index_add_(0, index, deform_xyz, alpha=scale)
+
+    @torch.no_grad()
+    def update_deformation_table(self,threshold, promote_threshold=0.0):
+        """
+        Gaussians whose mean |xyz offset| since the last update exceeds
+        threshold stay dynamic, the others become static. Static Gaussians
+        are never deformed, so they are promoted (and dynamic ones kept) by
+        an average view-space gradient of at least promote_threshold
+        instead: a Gaussian that cannot follow the motion keeps a large
+        gradient. With promote_threshold 0, demotion is one-way.
+        """
         # print("origin deformation point nums:",self._deformation_table.sum())
         self._deformation_table = torch.gt(self._deformation_accum.max(dim=-1).values/100,threshold)
+        if promote_threshold > 0:
+            grads = (self.xyz_gradient_accum / self.denom).squeeze(-1)
+            self._deformation_table |= grads.nan_to_num(0.0) >= promote_threshold
+        self.partition_deformation_table()
+        # the next update reads the statistics of the next interval, also when its densification is skipped
+        self._deformation_accum.zero_()
 
 
-    def partial_gaussian_deformation(self, t):
-        idx = torch.tensor(t*CURVE_NUM).floor().int().item() + 2
-        if self.gm_num > 0:
-            min_idx = max(idx - self.gm_num, 0)
-            max_idx = min(idx + self.gm_num, CURVE_NUM)
+    @torch.no_grad()
+    def sparsify_deformation(self):
+        """
+        The first call packs _coefs (and its Adam moments) to the sparse_topk
+        kernels with the largest |weight| per Gaussian and channel, and
+        _sparse_index keeps their kernel index (uint8, int16 beyond 256
+        kernels). Later calls swap kernels: of the sparse_regrow_fraction of
+        all kept kernels with the smallest |weight|, each is replaced by the
+        dropped kernel of its Gaussian and channel with the largest
+        _kernel_scores, which restarts from its initial coefficients with
+        zero moments. Without scores nothing is swapped.
+        """
+        if self._sparse_index is None:
+            self._pack_coefs()
+        elif self._kernel_scores is not None:
+            self._regrow_kernels()
+        self._kernel_scores = None
+        self._storage.release("kernel_scores")
+        self.sparse_warmup = False
+
+    def _pack_coefs(self):
+        index = topk_kernel_index(self.basis.view(self._coefs.detach()).float(), self.sparse_topk)
+
+        def pack(key, tensor):
+            return self._storage.assign(key, tensor, gather_kernels(self.basis.view(tensor.detach()), index).flatten(1))
+
+        coefs = nn.Parameter(pack("coefs", self._coefs).requires_grad_(True))
+        if self.optimizer is not None:
+            for group in self.optimizer.param_groups:
+                if group["name"] != "coefs":
+                    continue
+                stored_state = self.optimizer.state.pop(group['params'][0], None)
+                if stored_state is not None:
+                    for key, value in stored_state.items():
+                        # exp_avg, exp_avg_sq and the master weights, not the per-Gaussian row_step
+                        if key != "step" and value.shape == self._coefs.shape:
+                            stored_state[key] = pack("coefs." + key, value)
+                    self.optimizer.state[coefs] = stored_state
+                group["params"][0] = coefs
+        self._coefs = coefs
+        self._sparse_index = self._storage.assign("sparse_index", index, index.to(kernel_index_dtype(self.basis.curve_num)))
+
+    def _regrow_kernels(self):
+        index = self._sparse_index.long()
+        coefs = self._coefs_view(self._coefs.data)
+        weight = coefs[:, :, 0].abs().float()
+        num_dropped = int(self.sparse_regrow_fraction * weight.numel())
+        if num_dropped == 0:
+            return
+        drop = torch.zeros_like(weight, dtype=torch.bool)
+        drop.view(-1)[weight.view(-1).topk(num_dropped, largest=False).indices] = True
+        # the best dropped kernels of every Gaussian and channel, in descending order, go to its dropped slots in turn
+        scores = self._kernel_scores.abs().scatter(-1, index, -1.0)
+        grow_scores, grow = scores.topk(index.shape[-1], dim=-1)
+        rank = (drop.long().cumsum(-1) - 1).clamp(min=0)
+        swap = drop & (grow_scores.gather(-1, rank) > 0)
+        if not swap.any():
+            return
+        index = torch.where(swap, grow.gather(-1, rank), index)
+        initial = self.basis.view(self.basis.initial_coefs(1, self.args.init_param).to(coefs.device))
+        initial = gather_kernels(initial.expand(index.shape[0], -1, -1, -1), index)
+        swap = swap.unsqueeze(2).expand_as(coefs)
+        coefs.copy_(torch.where(swap, initial.to(coefs.dtype), coefs))
+        stored_state = self.optimizer.state.get(self._coefs, None) if self.optimizer is not None else None
+        if stored_state is not None:
+            for key, value in stored_state.items():
+                if key != "step" and value.shape == self._coefs.shape:
+                    value = self._coefs_view(value)
+                    value.copy_(torch.where(swap, initial.to(value.dtype) if key == "master" else 0, value))
+        self._sparse_index.copy_(index)
+
+    def _sparse_evaluation(self):
+        # are the coefficients packed? Dense models are packed on first use after the warm-up
+        if self._sparse_index is None and self.sparse_topk > 0 and not self.sparse_warmup:
+            self.sparsify_deformation()
+        return self._sparse_index is not None
+
+    def sample_kernel_scores(self, iteration):
+        # collect _kernel_scores in the renders of this iteration? Over the last sparse_score_iters before every re-sparsification
+        interval = self.sparsify_interval
+        self.collect_kernel_scores = self._sparse_index is not None and interval > 0 and (-iteration) % interval < self.sparse_score_iters
+
+    @torch.no_grad()
+    def add_kernel_scores(self, grad, t, channels, index=None):
+        """
+        Accumulate into _kernel_scores [N_dynamic, CH, curve_num] the gradient
+        the weight of every kernel would receive at zero weight with its
+        initial center and width, from the gradient grad of the deformation
+        of the channel range channels (of the dynamic Gaussians index, the
+        dynamic prefix if None): grad times the kernel at t.
+        """
+        if self._kernel_scores is None:
+            self._kernel_scores = self._storage.zeros("kernel_scores", (self._coefs.shape[0], self.ch_num, self.basis.curve_num),
+                                                      device=grad.device)
+        initial = self.basis.view(self.basis.initial_coefs(1, self.args.init_param).to(grad.device))[0, channels]
+        exponent = (t - initial[:, 1])**2/(initial[:, 2]**2+1e-6)
+        scores = grad.float().unsqueeze(-1) * torch.exp(-exponent**2)
+        if index is None:
+            self._kernel_scores[:scores.shape[0], channels] += scores
         else:
-            min_idx = 0
-            max_idx = CURVE_NUM
-        N = len(self._xyz)
-        coefs = self._coefs.reshape(N, CH_NUM, 3 , CURVE_NUM).contiguous() 
-        coefs = torch.split(coefs, [min_idx, max_idx-min_idx, CURVE_NUM-max_idx], -1)
-        # coefs = torch.split(coefs, [min_idx, max_idx-min_idx, CURVE_NUM-max_idx], -1)
-        deform = 0
-        for i, coef in enumerate(coefs):
-            if i != 1:
-                coef = coef.clone().detach()
-            weight, mu, sigma = torch.chunk(coef,3,-2)                         # [N, C:11, 1, m:10]
-            exponent = (t - mu)**2/(sigma**2+1e-6)
-            gaussian =  torch.exp(-exponent**2)         
-            deform += (gaussian*weight).sum(-1).squeeze()
+            self._kernel_scores[:, channels].index_add_(0, index, scores)
+
+    def partial_gaussian_deformation(self, t, channels=GEOMETRY_CHANNELS, index=None):
+        """
+        Deformation [N_dynamic, C] of the dynamic Gaussians at time t for the
+        channel range `channels` (see DEFORM_CHANNELS); only those channels
+        are evaluated. With index, only the dynamic Gaussians index are
+        deformed and [len(index), C] is returned.
+        """
+        if self.deformation_checkpoint and torch.is_grad_enabled():
+            # keep nothing but the inputs for backward and evaluate the deformation again there
+            deform = checkpoint(self._partial_gaussian_deformation, t, channels, index, use_reentrant=False)
+        else:
+            deform = self._partial_gaussian_deformation(t, channels, index)
+        if self.collect_kernel_scores and deform.requires_grad:
+            deform.register_hook(lambda grad: self.add_kernel_scores(grad, t, channels, index))
         return deform
 
-    def deformation(self, xyz: torch.Tensor, scales: torch.Tensor, rotations: torch.Tensor, time: float):
-        deform = self.partial_gaussian_deformation(time)
+    def _partial_gaussian_deformation(self, t, channels, index):
+        # only the dynamic prefix of the Gaussians is deformed
+        sparse = self._sparse_evaluation()
+        coefs = self._coefs[:self._num_dynamic]
+        if index is not None:
+            coefs = coefs[index]
+        coefs = self._coefs_view(coefs)[:, channels].float()
+        if sparse:
+            return sparse_gaussian_deformation(coefs, t)
+        return self.basis.evaluate(coefs, t)
+
+    def render_attributes(self, t):
+        """
+        Deformed means3D and activated scales, rotations and opacity of all
+        Gaussians at the time tensor t, plus the |xyz offset| of the dynamic
+        prefix for _deformation_accum. The window is derived from t on the
+        device and no shape depends on t, so with compile_deformation the
+        whole function is captured once by torch.compile (compile_mode
+        "reduce-overhead" adds CUDA graphs). With deformation_checkpoint, the
+        compiled function is run again in backward, as in
+        partial_gaussian_deformation.
+        """
+        sparse = self._sparse_evaluation()
+        if self._render_attributes_fn is None:
+            self._render_attributes_fn = self._render_attributes
+            if self.compile_deformation:
+                self._render_attributes_fn = torch.compile(self._render_attributes, mode=self.compile_mode, dynamic=True)
+        inputs = (self._xyz, self._scaling, self._rotation, self._opacity, self._coefs, sparse, t, self._num_dynamic)
+        if self.deformation_checkpoint and torch.is_grad_enabled():
+            return checkpoint(self._render_attributes_fn, *inputs, use_reentrant=False)
+        return self._render_attributes_fn(*inputs)
+
+    def _render_attributes(self, xyz, scaling, rotation, opacity, coefs, sparse, t, n_dynamic):
+        if sparse:
+            # all packed kernels are evaluated
+            coefs = coefs[:n_dynamic].view(n_dynamic, self.ch_num, 3, -1)[:, GEOMETRY_CHANNELS].float()
+            deform = static_window_gaussian_deformation(coefs, t, 0)
+        else:
+            coefs = self.basis.view(coefs[:n_dynamic])[:, GEOMETRY_CHANNELS].float()
+            deform = self.basis.evaluate_static(coefs, t)
+        means3D = torch.cat((xyz[:n_dynamic] + deform[:, :3], xyz[n_dynamic:]))
+        rotations = torch.cat((rotation[:n_dynamic] + deform[:, 3:7], rotation[n_dynamic:]))
+        scales = torch.cat((scaling[:n_dynamic] + deform[:, 7:10], scaling[n_dynamic:]))
+        return means3D, self.scaling_activation(scales), self.rotation_activation(rotations), \
+            self.opacity_activation(opacity), deform[:, :3].detach().abs()
+
+    def deformation(self, xyz: torch.Tensor, scales: torch.Tensor, rotations: torch.Tensor, time: float, index=None):
+        deform = self.partial_gaussian_deformation(time, GEOMETRY_CHANNELS, index)
         deform_xyz = deform[:,:3]
         deform_rot = deform[:, 3:7]
         deform_scaling = deform[:, 7:10]
-        if CH_NUM>=11:
-            # self.deform_opacity = deform[:, 10:]
-            deform_brightness = deform[:, None, 10:]
-        xyz += deform_xyz
-        rotations += deform_rot
-        scales += deform_scaling
+        xyz = xyz + deform_xyz
+        rotations = rotations + deform_rot
+        scales = scales + deform_scaling
         return xyz, scales, rotations
 
+    def deform_batch_frames(self, memory_budget_mb):
+        # number of timestamps whose kernel evaluation and stacked outputs fit into the budget
+        coefs_per_channel = self._coefs.shape[1] // self.ch_num
+        frame_bytes = 4 * (self._num_dynamic * GEOMETRY_CHANNELS.stop * (coefs_per_channel + 1) + self._xyz.shape[0] * 10)
+        return max(1, int(memory_budget_mb * 2**20) // max(frame_bytes, 1))
+
+    @torch.no_grad()
+    def _dynamic_coefs(self, channels=GEOMETRY_CHANNELS):
+        # coefficients of the dynamic prefix in the channel range channels, the packed top-k kernels in sparse mode
+        self._sparse_evaluation()
+        return self._coefs_view(self._coefs.detach()[:self._num_dynamic])[:, channels].float()
+
+    @torch.no_grad()
+    def _dynamic_deformation_batch(self, times, memory_budget_mb):
+        # geometry channel offsets [T, N_dynamic, 10] of the dynamic prefix
+        if self.sequential_deformation is not None:
+            return torch.stack([self._sequential_step(t) for t in times.tolist()])
+        coefs = self._dynamic_coefs()
+        if self.time_index is not None:
+            return torch.stack([self._time_culled_deformation(coefs, t) for t in times.tolist()])
+        return self.basis.evaluate_batch(coefs, times, self.deform_batch_frames(memory_budget_mb))
+
+    @torch.no_grad()
+    def update_motion_bounds(self):
+        """
+        Conservative world space AABB of every Gaussian over t in [0, 1]:
+        the bounds of the position offsets around _xyz, and the radius of 3
+        sigma of the largest scale the Gaussian can reach, which
+        motion_frustum_mask grows by the render's scaling_modifier.
+        """
+        N, n_dynamic = self._xyz.shape[0], self._num_dynamic
+        # only the position and scaling channels are bounded, rotation does not move the AABB
+        lower_xyz, upper_xyz, upper_scaling = self._xyz.new_zeros((3, N, 3)).unbind()
+        if n_dynamic > 0:
+            lower_xyz[:n_dynamic], upper_xyz[:n_dynamic] = self.basis.offset_bounds(self._dynamic_coefs(DEFORM_CHANNELS["xyz"]))
+            upper_scaling[:n_dynamic] = self.basis.offset_bounds(self._dynamic_coefs(DEFORM_CHANNELS["scaling"]))[1]
+        radius = 3 * self.scaling_activation(self._scaling.detach() + upper_scaling).max(-1, keepdim=True).values
+        self._motion_bounds = (self._xyz.detach() + lower_xyz, self._xyz.detach() + upper_xyz, radius)
+        self._motion_bounds_token = self._deformation_state_token()
+
+    @torch.no_grad()
+    def motion_frustum_mask(self, viewpoint_camera, scaling_modifier=1.0):
+        # Gaussians whose motion bounds intersect the view frustum at any time, refreshed whenever the parameters change
+        if self._motion_bounds is None or self._motion_bounds_token != self._deformation_state_token():
+            self.update_motion_bounds()
+        lower, upper, radius = self._motion_bounds
+        planes = frustum_planes(viewpoint_camera.world_view_transform.cuda(), viewpoint_camera.full_proj_transform.cuda())
+        return aabb_in_frustum(lower - scaling_modifier * radius, upper + scaling_modifier * radius, planes)
+
+    def enable_time_index(self, tolerance):
+        """
+        Index the dynamic Gaussians by the time interval in which any of their
+        kernels contributes more than tolerance (0 disables). No-grad
+        deformations then only evaluate the Gaussians active at t, the others
+        keep their canonical geometry. Gaussian basis only.
+        """
+        assert tolerance <= 0 or self.basis.name == "gaussian", "the time index requires the gaussian deformation basis"
+        self.time_index_tolerance = tolerance
+        self.time_index = None
+        if tolerance > 0:
+            self._time_index_token = self._deformation_state_token()
+            self.time_index = TimeIntervalIndex(*gaussian_activity_intervals(self._dynamic_coefs(), tolerance))
+
+    @torch.no_grad()
+    def _time_culled_deformation(self, coefs, t):
+        # geometry offsets [N_dynamic, 10] at time t, zero for the Gaussians outside their activity interval
+        if self._deformation_state_token() != self._time_index_token:
+            self.enable_time_index(self.time_index_tolerance)
+        deform = coefs.new_zeros(coefs.shape[:2])
+        active = self.time_index.active(t)
+        if active.numel() > 0:
+            times = torch.tensor([t], dtype=coefs.dtype, device=coefs.device)
+            deform[active] = self.basis.evaluate_batch(coefs[active], times, 1)[0]
+        return deform
+
+    def enable_sequential_playback(self, tolerance):
+        """
+        Evaluate no-grad deformations incrementally from frame to frame,
+        re-evaluating only the kernels that may have changed by more than
+        tolerance (0 disables). Gaussian basis only.
+        """
+        assert tolerance <= 0 or self.basis.name == "gaussian", "sequential playback requires the gaussian deformation basis"
+        self.sequential_tolerance = tolerance
+        self.sequential_deformation = None
+        if tolerance > 0:
+            self._sequential_token = self._deformation_state_token()
+            self.sequential_deformation = IncrementalGaussianDeformation(self._dynamic_coefs(), tolerance)
+
+    def _sequential_step(self, t):
+        # rebuild the incremental state when the parameters changed since it was created
+        if self._deformation_state_token() != self._sequential_token:
+            self.enable_sequential_playback(self.sequential_tolerance)
+        return self.sequential_deformation(t)
+
+    @torch.no_grad()
+    def deform_batch(self, times, memory_budget_mb=1024):
+        """
+        Deform all Gaussians for a batch of timestamps in one vectorized pass.
+
+        times: [T] tensor (or sequence) of timestamps.
+        Returns the stacked deformed xyz [T, N, 3], scales [T, N, 3] and
+        rotations [T, N, 4], before activation, as consumed by render_flow.
+        """
+        times = torch.as_tensor(times, dtype=torch.float, device=self._xyz.device).flatten()
+        T, N = times.shape[0], self._xyz.shape[0]
+        n_dynamic = self._num_dynamic
+        if self.baked_deformation is not None:
+            deform = self._baked_deformation_lookup(times)
+        else:
+            deform = self._dynamic_deformation_batch(times, memory_budget_mb)
+
+        xyz = self._xyz.detach().expand(T, N, 3).clone()
+        scales = self._scaling.detach().expand(T, N, 3).clone()
+        rotations = self._rotation.detach().expand(T, N, 4).clone()
+        xyz[:, :n_dynamic] += deform[..., :3]
+        rotations[:, :n_dynamic] += deform[..., 3:7]
+        scales[:, :n_dynamic] += deform[..., 7:10]
+        return xyz, scales, rotations
+
+    @torch.no_grad()
+    def bake_deformation(self, path, num_samples, memory_budget_mb=1024):
+        """
+        Sample the geometry offsets of the dynamic Gaussians at num_samples
+        uniformly spaced times in [0, 1] into a [num_samples, N_dynamic, 10]
+        float16 .npy table that can be memory-mapped for playback.
+        """
+        assert num_samples >= 2, "baking needs at least two samples"
+        mkdir_p(os.path.dirname(path))
+        table = np.lib.format.open_memmap(path, mode="w+", dtype=np.float16,
+                                          shape=(num_samples, self._num_dynamic, GEOMETRY_CHANNELS.stop))
+        times = torch.linspace(0, 1, num_samples, device=self._xyz.device)
+        chunk = self.deform_batch_frames(memory_budget_mb)
+        for start in range(0, num_samples, chunk):
+            deform = self._dynamic_deformation_batch(times[start:start+chunk], memory_budget_mb)
+            table[start:start+deform.shape[0]] = deform.half().cpu().numpy()
+        table.flush()
+        del table
+
+    def load_baked_deformation(self, path, release_coefs=True):
+        """
+        Play back deformations from a table written by bake_deformation. The
+        table stays on disk and only the two samples around each requested
+        time are read. With release_coefs, _coefs is moved off the device.
+        """
+        self.baked_deformation = np.load(path, mmap_mode="r")
+        assert self.baked_deformation.shape[1] == self._num_dynamic, "baked table does not match the dynamic Gaussians"
+        if release_coefs:
+            self._coefs = self._coefs.detach().cpu()
+
+    def _baked_deformation_lookup(self, times):
+        # linear interpolation between the two nearest baked samples, [T, N_dynamic, 10]
+        table = self.baked_deformation
+        u = times.cpu().numpy() * (table.shape[0] - 1)
+        idx = np.clip(np.floor(u), 0, table.shape[0] - 2).astype(np.int64)
+        weight = torch.from_numpy(u - idx).float().to(self._xyz.device)[:, None, None]
+        lower = torch.from_numpy(np.asarray(table[idx])).to(self._xyz.device).float()
+        upper = torch.from_numpy(np.asarray(table[idx + 1])).to(self._xyz.device).float()
+        return torch.lerp(lower, upper, weight)
+
+    @torch.no_grad()
+    def factorize_motion(self, rank, num_samples=100, memory_budget_mb=1024):
+        """
+        Convert a trained model to the low-rank motion basis. The deformation
+        curves of all Gaussians, sampled at num_samples times, are compressed
+        by an SVD into `rank` shared trajectories and per-channel mixing
+        weights. Returns the fraction of the sampled motion energy that is
+        not captured by the rank trajectories.
+        """
+        assert self.optimizer is None, "factorize_motion converts a loaded model, call training_setup afterwards"
+        assert num_samples >= self.args.motion_knots, "fitting motion_knots control points needs num_samples >= motion_knots"
+        N = self._coefs.shape[0]
+        coefs = self._coefs_view(self._coefs.detach()).float()
+        times = torch.linspace(0, 1, num_samples, device=coefs.device)
+        row_bytes = 4 * num_samples * self.ch_num * (self.basis.coefs_per_channel + 1)
+        rows = max(1, int(memory_budget_mb * 2**20) // row_bytes)
+
+        # the trajectories are the leading eigenvectors of the [T, T] Gram matrix of all sampled curves
+        gram = torch.zeros((num_samples, num_samples), device=coefs.device, dtype=torch.float64)
+        for start in range(0, N, rows):
+            samples = self.basis.evaluate_batch(coefs[start:start+rows], times, num_samples).flatten(1).double()
+            gram += samples @ samples.T
+        energy, vectors = torch.linalg.eigh(gram)
+        residual = 1 - (energy[-rank:].sum() / energy.sum().clamp(min=1e-12)).item()
+
+        args = copy.copy(self.args)
+        args.deform_basis, args.motion_rank = "lowrank", rank
+        basis = LowRankBasis(self.ch_num, self.curve_num, args).to(coefs.device)
+        trajectories = basis.fit_bank(vectors[:, -rank:].flip(-1).float(), times)
+        projection = torch.linalg.pinv(trajectories)
+        weights = coefs.new_empty((N, self.ch_num, rank))
+        for start in range(0, N, rows):
+            samples = self.basis.evaluate_batch(coefs[start:start+rows], times, num_samples)
+            weights[start:start+rows] = torch.einsum("rt,tnc->ncr", projection, samples)
+
+        self.args = args
+        self.basis = basis
+        self._coefs = nn.Parameter(weights.reshape(N, -1).to(self.coefs_dtype).requires_grad_(True))
+        self._storage.release("coefs")
+        self.sparse_topk = 0
+        self._sparse_index = None
+        self._storage.release("sparse_index")
+        return residual
+
+    def memory_report(self, num_points=None):
+        # predicted training memory for num_points Gaussians, all dynamic (default: the current count and dynamic Gaussians)
+        num_dynamic = self._num_dynamic if num_points is None else None
+        num_points = self.get_xyz.shape[0] if num_points is None else num_points
+        sparse_topk = 0 if self._sparse_index is None else self._sparse_index.shape[-1]
+        return format_memory_report(num_points, estimate_model_memory(
+            num_points, self.basis, self.max_sh_degree, self.coefs_dtype, self.coefs_state_dtype, self.coefs_rounding == "master",
+            num_dynamic, sparse_topk))
+
+    def enable_deformation_cache(self, max_mb, resolution=10000):
+        self.deformation_cache = DeformationCache(int(max_mb * 2**20), resolution) if max_mb > 0 else None
+
+    def _deformation_state_token(self):
+        # changes whenever a tensor the deformed state depends on is replaced or updated in place
+        tensors = (self._xyz, self._scaling, self._rotation, self._coefs, self._deformation_table) + tuple(self.basis.parameters())
+        return tuple((t.data_ptr(), t._version, tuple(t.shape)) for t in tensors)
+
+    @torch.no_grad()
+    def cached_deformation(self, time):
+        """
+        Deformed (xyz, scales, rotations) at the given time, served from the
+        LRU deformation cache when possible.
+        """
+        cache = self.deformation_cache
+        cache.validate(self._deformation_state_token())
+        key = cache.key(time)
+        entry = cache.get(key)
+        if entry is None:
+            xyz, scales, rotations = self.deform_batch([float(time)])
+            entry = (xyz[0], scales[0], rotations[0])
+            cache.put(key, entry)
+        return entry
 
     def print_deformation_weight_grad(self):
         for name, weight in self._deformation.named_parameters():
@@ -725,8 +1492,8 @@ class GaussianModel:
         print("-"*50)
     
     def compute_sparsity_regulation(self,):
-        N = len(self._xyz)
-        ch_num = CH_NUM
+        N = self._coefs.shape[0]
+        ch_num = self.ch_num
         coefs = self._coefs.reshape(N, ch_num, -1).contiguous() # [N, 7, ORDER_NUM + ORDER_NUM * 2 ]
         return (torch.sum(torch.abs(coefs), dim=-1, keepdim=True)\
             /torch.abs(coefs.max(dim=-1, keepdim = True)[0])).mean()   
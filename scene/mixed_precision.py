@@ -0,0 +1,90 @@
+import math
+
+import torch
+
+DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+}
+ROUNDING_MODES = ("master", "stochastic")
+
+
+def stochastic_round_bf16(x):
+    # round fp32 x to bfloat16, away from zero with probability proportional to the truncated bits
+    bits = x.view(torch.int32)
+    noise = torch.randint_like(bits, 0, 1 << 16)
+    return ((bits + noise) & -65536).view(torch.float32).to(torch.bfloat16)
+
+
+class MixedPrecisionAdam(torch.optim.Adam):
+    """
+    Adam for parameters stored in reduced precision.
+
+    Param groups with "mixed_precision" set are stepped in fp32 and written
+    back to the parameter dtype, either from an fp32 master copy kept in the
+    optimizer state ("master") or with stochastic rounding ("stochastic",
+    bfloat16 only). Their moments are stored in the group's "state_dtype".
+    All other groups are handled by torch.optim.Adam.
+    """
+
+    @torch.no_grad()
+    def step(self, closure=None):
+        mixed = [p for group in self.param_groups if group.get("mixed_precision", False) for p in group["params"]]
+        grads = [p.grad for p in mixed]
+        for p in mixed:
+            p.grad = None
+        loss = super().step(closure)
+        for p, grad in zip(mixed, grads):
+            p.grad = grad
+        for group in self.param_groups:
+            if group.get("mixed_precision", False):
+                self._mixed_precision_step(group)
+        return loss
+
+    def _mixed_precision_step(self, group):
+        beta1, beta2 = group["betas"]
+        for p in group["params"]:
+            if p.grad is None:
+                continue
+            state = self.state[p]
+            if len(state) == 0:
+                state["step"] = torch.tensor(0.0)
+                state["exp_avg"] = torch.zeros_like(p, dtype=group["state_dtype"])
+                state["exp_avg_sq"] = torch.zeros_like(p, dtype=group["state_dtype"])
+                if group["rounding"] == "master" and p.dtype != torch.float32:
+                    state["master"] = p.detach().float()
+            state["step"] += 1
+            step = state["step"].item()
+
+            grad = p.grad.float()
+            exp_avg = state["exp_avg"].float()
+            exp_avg_sq = state["exp_avg_sq"].float()
+            exp_avg.lerp_(grad, 1 - beta1)
+            exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+            state["exp_avg"].copy_(exp_avg)
+            state["exp_avg_sq"].copy_(exp_avg_sq)
+
+            bias_correction1 = 1 - beta1 ** step
+            bias_correction2 = 1 - beta2 ** step
+            denom = exp_avg_sq.sqrt().div_(math.sqrt(bias_correction2)).add_(group["eps"])
+            if p.dtype == torch.float32:
+                p.addcdiv_(exp_avg, denom, value=-group["lr"] / bias_correction1)
+                continue
+            master = state["master"] if "master" in state else p.float()
+            master.addcdiv_(exp_avg, denom, value=-group["lr"] / bias_correction1)
+            if "master" in state:
+                p.copy_(master)
+            else:
+                p.copy_(stochastic_round_bf16(master))
+
+    def load_state_dict(self, state_dict):
+        super().load_state_dict(state_dict)
+        # Optimizer.load_state_dict casts the state to the parameter dtype, restore the stored precision
+        params = [p for group in self.param_groups for p in group["params"]]
+        mixed = {id(p) for group in self.param_groups if group.get("mixed_precision", False) for p in group["params"]}
+        for idx, p in enumerate(params):
+            if id(p) in mixed and idx in state_dict["state"]:
+                for key, value in state_dict["state"][idx].items():
+                    if key != "step":
+                        self.state[p][key] = value.to(device=p.device)
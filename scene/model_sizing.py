@@ -0,0 +1,59 @@
+import torch
+
+from scene.deformation_kernels import kernel_index_dtype
+
+FLOAT_BYTES = 4
+# Adam keeps exp_avg and exp_avg_sq next to the gradient of every parameter
+OPTIMIZER_COPIES = 3
+
+
+def gaussian_floats(sh_degree):
+    # xyz, f_dc, f_rest, opacity, scaling and rotation of one Gaussian
+    return 3 + 3 + 3 * ((sh_degree + 1) ** 2 - 1) + 1 + 3 + 4
+
+
+def estimate_model_memory(num_points, basis, sh_degree, coefs_dtype=torch.float32, state_dtype=torch.float32, master_weights=True,
+                          num_dynamic=None, sparse_topk=0):
+    """
+    Predicted device memory in bytes of a GaussianModel with num_points
+    Gaussians during training, split into the deformation coefficients,
+    the remaining Gaussian parameters, their optimizer state and the
+    densification statistics. coefs_dtype, state_dtype and master_weights
+    describe the mixed precision storage of _coefs (see MixedPrecisionAdam).
+    Only the num_dynamic (default: all) dynamic Gaussians store coefficients,
+    with sparse_topk only the packed kernels and their kernel index.
+    """
+    num_dynamic = num_points if num_dynamic is None else num_dynamic
+    coefs_per_channel = basis.coefs_per_kernel * sparse_topk if sparse_topk > 0 else basis.coefs_per_channel
+    coefs_num = num_dynamic * basis.ch_num * coefs_per_channel
+    coefs = coefs_num * torch.finfo(coefs_dtype).bits // 8
+    # gradient, exp_avg, exp_avg_sq and an fp32 master copy of reduced precision coefficients
+    coefs_optimizer = coefs + 2 * coefs_num * torch.finfo(state_dtype).bits // 8
+    if master_weights and coefs_dtype != torch.float32:
+        coefs_optimizer += coefs_num * FLOAT_BYTES
+    gaussians = num_points * gaussian_floats(sh_degree) * FLOAT_BYTES
+    # xyz_gradient_accum, denom, _deformation_accum, max_radii2D and the bool _deformation_table
+    statistics = num_points * ((1 + 1 + 3 + 1) * FLOAT_BYTES + 1)
+    sizes = {
+        "coefs": coefs,
+        "coefs_optimizer": coefs_optimizer,
+        "gaussians": gaussians,
+        "gaussians_optimizer": OPTIMIZER_COPIES * gaussians,
+        "statistics": statistics,
+    }
+    if sparse_topk > 0:
+        sizes["sparse_index"] = num_dynamic * basis.ch_num * sparse_topk * torch.iinfo(kernel_index_dtype(basis.curve_num)).bits // 8
+    sizes["total"] = sum(sizes.values())
+    return sizes
+
+
+def max_gaussians(budget_bytes, basis, sh_degree, *precision):
+    # largest Gaussian count whose estimate_model_memory total fits into budget_bytes
+    return int(budget_bytes // estimate_model_memory(1, basis, sh_degree, *precision)["total"])
+
+
+def format_memory_report(num_points, sizes):
+    lines = ["memory estimate for {} Gaussians:".format(num_points)]
+    for name, nbytes in sizes.items():
+        lines.append("  {:<20s} {:>10.1f} MB".format(name, nbytes / 2**20))
+    return "\n".join(lines)
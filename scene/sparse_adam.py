@@ -0,0 +1,74 @@
+import torch
+
+from scene.mixed_precision import MixedPrecisionAdam
+
+
+class SparseAdam(MixedPrecisionAdam):
+    """
+    Adam that only updates the rows (Gaussians) selected by a visibility
+    mask in the param groups with "sparse" set. The parameter and both
+    moments of all other rows are left untouched (lazy Adam), so the cost
+    follows the number of visible Gaussians instead of the model size.
+
+    Bias correction uses the step count of the group, or with
+    "row_bias_correction" the number of updates each row has received,
+    kept in the per-Gaussian "row_step" state. Groups with "prefix" hold
+    rows for the leading Gaussians of the mask only. Parameters whose row
+    count does not match the mask (e.g. right after densification) and all
+    other groups take the dense MixedPrecisionAdam step.
+    """
+
+    @torch.no_grad()
+    def step(self, closure=None, visibility=None):
+        if visibility is None:
+            return super().step(closure)
+        sparse = {}
+        for group in self.param_groups:
+            if not group.get("sparse", False):
+                continue
+            for p in group["params"]:
+                # rows of "prefix" groups are the leading Gaussians of the mask (e.g. the dynamic prefix)
+                mask = visibility[:p.shape[0]] if group.get("prefix", False) else visibility
+                if p.grad is not None and p.shape[0] == mask.shape[0]:
+                    sparse[id(p)] = (p, p.grad, mask.nonzero().squeeze(1))
+        for p, _, _ in sparse.values():
+            p.grad = None
+        loss = super().step(closure)
+        for p, grad, _ in sparse.values():
+            p.grad = grad
+        for group in self.param_groups:
+            for p in group["params"]:
+                if id(p) in sparse:
+                    self._sparse_step(group, p, sparse[id(p)][2])
+        return loss
+
+    def _sparse_step(self, group, p, rows):
+        beta1, beta2 = group["betas"]
+        state = self.state[p]
+        if len(state) == 0:
+            state["step"] = torch.tensor(0.0)
+            state["exp_avg"] = torch.zeros_like(p)
+            state["exp_avg_sq"] = torch.zeros_like(p)
+        if group.get("row_bias_correction", False) and "row_step" not in state:
+            # rows of a dense Adam state have been updated every step so far
+            state["row_step"] = torch.full((p.shape[0],), float(state["step"]), device=p.device)
+        state["step"] += 1
+
+        grad = p.grad[rows]
+        exp_avg = state["exp_avg"][rows].lerp_(grad, 1 - beta1)
+        exp_avg_sq = state["exp_avg_sq"][rows].mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+        state["exp_avg"].index_copy_(0, rows, exp_avg)
+        state["exp_avg_sq"].index_copy_(0, rows, exp_avg_sq)
+
+        if "row_step" in state:
+            row_step = state["row_step"][rows] + 1
+            state["row_step"].index_copy_(0, rows, row_step)
+            row_step = row_step.view((-1,) + (1,) * (p.dim() - 1))
+            bias_correction1 = 1 - beta1 ** row_step
+            bias_correction2 = 1 - beta2 ** row_step
+        else:
+            step = state["step"].item()
+            bias_correction1 = 1 - beta1 ** step
+            bias_correction2 = 1 - beta2 ** step
+        denom = (exp_avg_sq / bias_correction2).sqrt_().add_(group["eps"])
+        p.index_add_(0, rows, exp_avg / bias_correction1 / denom, alpha=-group["lr"])
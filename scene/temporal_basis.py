@@ -0,0 +1,296 @@
+import math
+
+import torch
+from torch import nn
+
+from scene.deformation_kernels import deformation_window, windowed_gaussian_deformation, \
+    windowed_gaussian_deformation_reference, batched_gaussian_deformation, static_window_gaussian_deformation
+
+
+class TemporalBasis:
+    """
+    Temporal basis of the per-Gaussian deformation curves.
+
+    Every Gaussian stores coefs_per_channel coefficients for each of the ch_num
+    deformable channels, flattened into one row of GaussianModel._coefs.
+    view() exposes the structured layout used by evaluate/evaluate_batch.
+    """
+
+    name = None
+    coefs_per_kernel = 1
+
+    def __init__(self, ch_num, curve_num, args):
+        self.ch_num = ch_num
+        self.curve_num = curve_num
+
+    @property
+    def coefs_per_channel(self):
+        return self.coefs_per_kernel * self.curve_num
+
+    def view(self, coefs):
+        return coefs.view(coefs.shape[0], self.ch_num, self.curve_num)
+
+    def initial_coefs(self, N, init_param):
+        raise NotImplementedError
+
+    def evaluate(self, coefs, t):
+        # per-channel deformation [N, CH'] at scalar time t for the (possibly
+        # channel-sliced) view coefs, differentiable w.r.t. coefs
+        raise NotImplementedError
+
+    def evaluate_static(self, coefs, t):
+        # evaluate() for a 0-dim time tensor t without host syncs or t dependent shapes (torch.compile friendly)
+        return self.evaluate(coefs, t)
+
+    def evaluate_batch(self, coefs, times, frames_per_chunk):
+        # per-channel deformation [T, N, CH] for times [T], without gradients
+        raise NotImplementedError
+
+    def offset_bounds(self, coefs):
+        # conservative per-channel (lower, upper) [N, CH] of the deformation over t in [0, 1]
+        raise NotImplementedError
+
+    def parameters(self):
+        # learnable tensors shared by all Gaussians
+        return []
+
+    def to(self, device):
+        return self
+
+
+class GaussianBasis(TemporalBasis):
+    """
+    Gaussian RBF kernels exp(-((t-mu)^2/sigma^2)^2) with learnable weight,
+    center and width. Gradients are restricted to the gm_num kernels around t.
+    """
+
+    name = "gaussian"
+    coefs_per_kernel = 3
+
+    def __init__(self, ch_num, curve_num, args):
+        super().__init__(ch_num, curve_num, args)
+        self.gm_num = 8
+        self.fused = args.fused_deformation
+
+    def view(self, coefs):
+        return coefs.view(coefs.shape[0], self.ch_num, 3, self.curve_num)
+
+    def initial_coefs(self, N, init_param):
+        weight_coefs = torch.zeros((N, self.ch_num, self.curve_num))
+        position_coefs = torch.zeros((N, self.ch_num, self.curve_num)) + torch.linspace(0, 1, self.curve_num)
+        shape_coefs = torch.zeros((N, self.ch_num, self.curve_num)) + init_param
+        return torch.stack((weight_coefs, position_coefs, shape_coefs), dim=2).flatten(1)
+
+    def evaluate(self, coefs, t):
+        min_idx, max_idx = deformation_window(t, self.curve_num, self.gm_num)
+        if self.fused:
+            return windowed_gaussian_deformation(coefs, t, min_idx, max_idx)
+        return windowed_gaussian_deformation_reference(coefs, t, min_idx, max_idx)
+
+    def evaluate_static(self, coefs, t):
+        return static_window_gaussian_deformation(coefs, t, self.gm_num)
+
+    def evaluate_batch(self, coefs, times, frames_per_chunk):
+        return batched_gaussian_deformation(coefs, times, frames_per_chunk)
+
+    @torch.no_grad()
+    def offset_bounds(self, coefs):
+        # every kernel lies in [0, 1] before the weight
+        weight = coefs[:, :, 0]
+        return weight.clamp(max=0).sum(-1), weight.clamp(min=0).sum(-1)
+
+
+def bspline_weights(f):
+    # uniform cubic B-spline blending weights [..., 4] for the local coordinate f in [0, 1]
+    f2 = f * f
+    f3 = f2 * f
+    return torch.stack((
+        (1 - f)**3,
+        3 * f3 - 6 * f2 + 4,
+        -3 * f3 + 3 * f2 + 3 * f + 1,
+        f3,
+    ), dim=-1) / 6
+
+
+class BSplineBasis(TemporalBasis):
+    """
+    Uniform cubic B-spline with curve_num control points spanning t in [0, 1].
+    Any t touches exactly 4 control points per channel, so evaluation and
+    gradients are O(1) in curve_num.
+    """
+
+    name = "bspline"
+    coefs_per_kernel = 1
+
+    def __init__(self, ch_num, curve_num, args):
+        super().__init__(ch_num, curve_num, args)
+        assert curve_num >= 4, "a cubic B-spline needs at least 4 control points"
+        self.num_segments = curve_num - 3
+
+    def segment(self, t):
+        u = t * self.num_segments
+        idx = torch.clamp(torch.floor(u), 0, self.num_segments - 1)
+        return idx.long(), u - idx
+
+    def initial_coefs(self, N, init_param):
+        return torch.zeros((N, self.ch_num * self.curve_num))
+
+    def evaluate(self, coefs, t):
+        u = float(t) * self.num_segments
+        idx = min(max(int(math.floor(u)), 0), self.num_segments - 1)
+        weights = bspline_weights(torch.tensor(u - idx, dtype=coefs.dtype, device=coefs.device))
+        return coefs[..., idx:idx+4] @ weights
+
+    def evaluate_static(self, coefs, t):
+        # the blending weights of the 4 active control points scattered onto all of them, a gather free matmul
+        idx, f = self.segment(t)
+        weights = torch.zeros(self.curve_num, dtype=coefs.dtype, device=coefs.device)
+        weights = weights.scatter(0, idx + torch.arange(4, device=coefs.device), bspline_weights(f).to(coefs.dtype))
+        return coefs @ weights
+
+    @torch.no_grad()
+    def evaluate_batch(self, coefs, times, frames_per_chunk):
+        times = times.to(device=coefs.device, dtype=coefs.dtype)
+        N, ch_num = coefs.shape[:2]
+        deform = coefs.new_empty((times.shape[0], N, ch_num))
+        offsets = torch.arange(4, device=coefs.device)
+        for start in range(0, times.shape[0], frames_per_chunk):
+            idx, f = self.segment(times[start:start+frames_per_chunk])
+            control = coefs[..., idx[:, None] + offsets]                # [N, CH, T', 4]
+            chunk = torch.einsum("nctk,tk->tnc", control, bspline_weights(f))
+            deform[start:start+chunk.shape[0]] = chunk
+        return deform
+
+    @torch.no_grad()
+    def offset_bounds(self, coefs):
+        # convex hull property: the curve stays between its smallest and largest control point
+        return coefs.min(-1).values, coefs.max(-1).values
+
+
+def fourier_harmonics(theta, order):
+    """
+    [1, cos(k*theta), sin(k*theta)] for k = 1..order, stacked on the last dim.
+    Uses the angle-addition recurrence, so only one sin/cos pair is evaluated.
+    """
+    c1, s1 = torch.cos(theta), torch.sin(theta)
+    cos, sin = [c1], [s1]
+    for _ in range(order - 1):
+        cos.append(cos[-1] * c1 - sin[-1] * s1)
+        sin.append(sin[-1] * c1 + cos[-2] * s1)
+    return torch.stack([torch.ones_like(theta)] + cos + sin, dim=-1)
+
+
+class FourierBasis(TemporalBasis):
+    """
+    Truncated Fourier series a_0 + sum_k a_k cos(k*pi*t) + b_k sin(k*pi*t)
+    with curve_num harmonics. The fundamental period is 2, so a clip does not
+    have to end in the pose it started from; periodic motion such as
+    breathing or heartbeat is captured by the higher harmonics.
+    """
+
+    name = "fourier"
+    coefs_per_kernel = 2
+
+    @property
+    def coefs_per_channel(self):
+        return 2 * self.curve_num + 1
+
+    def view(self, coefs):
+        return coefs.view(coefs.shape[0], self.ch_num, self.coefs_per_channel)
+
+    def initial_coefs(self, N, init_param):
+        return torch.zeros((N, self.ch_num * self.coefs_per_channel))
+
+    def evaluate(self, coefs, t):
+        theta = torch.as_tensor(t, dtype=coefs.dtype, device=coefs.device) * math.pi
+        return coefs @ fourier_harmonics(theta, self.curve_num)
+
+    @torch.no_grad()
+    def evaluate_batch(self, coefs, times, frames_per_chunk):
+        theta = times.to(device=coefs.device, dtype=coefs.dtype) * math.pi
+        return torch.einsum("ncj,tj->tnc", coefs, fourier_harmonics(theta, self.curve_num))
+
+    @torch.no_grad()
+    def offset_bounds(self, coefs):
+        amplitude = coefs[..., 1:].abs().sum(-1)
+        return coefs[..., 0] - amplitude, coefs[..., 0] + amplitude
+
+
+class LowRankBasis(TemporalBasis):
+    """
+    Factorized motion: a learned bank of `rank` trajectories shared by all
+    Gaussians, each a uniform cubic B-spline with motion_knots control
+    points (instead of curve_num, the bank is shared so it can be finer).
+    Every Gaussian only stores `rank` mixing weights per channel, so the
+    deformation is one [N*CH, R] x [R] matmul per timestamp.
+    """
+
+    name = "lowrank"
+
+    def __init__(self, ch_num, curve_num, args):
+        super().__init__(ch_num, args.motion_knots, args)
+        self.rank = args.motion_rank
+        self.trajectory_basis = BSplineBasis(self.rank, self.curve_num, args)
+        # unit scale trajectories, the (zero initialized) mixing weights carry the amplitude
+        self.bank = nn.Parameter(torch.randn((self.rank, self.curve_num)))
+
+    @property
+    def coefs_per_channel(self):
+        return self.rank
+
+    def view(self, coefs):
+        return coefs.view(coefs.shape[0], self.ch_num, self.rank)
+
+    def initial_coefs(self, N, init_param):
+        return torch.zeros((N, self.ch_num * self.rank))
+
+    def trajectories(self, t):
+        # bank values [R] at scalar time t
+        return self.trajectory_basis.evaluate(self.bank[None], t)[0]
+
+    def evaluate(self, coefs, t):
+        return coefs @ self.trajectories(t).to(coefs.dtype)
+
+    def evaluate_static(self, coefs, t):
+        return coefs @ self.trajectory_basis.evaluate_static(self.bank[None], t)[0].to(coefs.dtype)
+
+    @torch.no_grad()
+    def evaluate_batch(self, coefs, times, frames_per_chunk):
+        trajectories = self.trajectory_basis.evaluate_batch(self.bank[None], times, frames_per_chunk)[:, 0]
+        return torch.einsum("ncr,tr->tnc", coefs, trajectories.to(coefs.dtype))
+
+    @torch.no_grad()
+    def offset_bounds(self, coefs):
+        # each trajectory stays within the range of its control points
+        bank_min, bank_max = self.bank.min(-1).values.to(coefs.dtype), self.bank.max(-1).values.to(coefs.dtype)
+        lower = torch.minimum(coefs * bank_min, coefs * bank_max).sum(-1)
+        upper = torch.maximum(coefs * bank_min, coefs * bank_max).sum(-1)
+        return lower, upper
+
+    def parameters(self):
+        return [self.bank]
+
+    def to(self, device):
+        self.bank.data = self.bank.data.to(device)
+        return self
+
+    @torch.no_grad()
+    def fit_bank(self, samples, times):
+        """
+        Least squares B-spline fit of sampled trajectories [T, R] at times [T]
+        into the bank. Returns the fitted trajectories [T, R].
+        """
+        basis = self.trajectory_basis
+        idx, f = basis.segment(times.to(samples.dtype))
+        design = samples.new_zeros((times.shape[0], self.curve_num))
+        design.scatter_(1, idx[:, None] + torch.arange(4, device=idx.device), bspline_weights(f))
+        self.bank.data = torch.linalg.lstsq(design, samples).solution.T.contiguous()
+        return design @ self.bank.T
+
+
+BASIS_TYPES = {
+    "gaussian": GaussianBasis,
+    "bspline": BSplineBasis,
+    "fourier": FourierBasis,
+    "lowrank": LowRankBasis,
+}
@@ -0,0 +1,34 @@
+import torch
+
+
+class TimeIntervalIndex:
+    """
+    Gaussians indexed by their temporal activity interval [start, end].
+
+    The intervals are sorted by start, so the Gaussians active at time t are
+    found by a binary search for the last start <= t followed by a filter
+    on end >= t over that prefix.
+    """
+
+    def __init__(self, start, end):
+        self.start, self.order = torch.sort(start)
+        self.end = end[self.order]
+        self.num_points = start.shape[0]
+        self.queries = 0
+        self.selected = 0
+
+    def active(self, t):
+        # indices of the Gaussians whose interval contains t, in ascending order
+        t = torch.tensor([float(t)], dtype=self.start.dtype, device=self.start.device)
+        count = torch.searchsorted(self.start, t, right=True).item()
+        active = self.order[:count][self.end[:count] >= t]
+        self.queries += 1
+        self.selected += active.numel()
+        return active.sort().values
+
+    def stats(self):
+        return {
+            "gaussians": self.num_points,
+            "queries": self.queries,
+            "active_fraction": self.selected / (self.queries * self.num_points) if self.queries and self.num_points else 0.0,
+        }
@@ -25,6 +25,7 @@ from argparse import ArgumentParser, Namespace
 from arguments import ModelParams, PipelineParams, OptimizationParams
 from arguments import FDMHiddenParams as ModelHiddenParams
 from utils.timer import Timer
+from scene.densification_scheduler import format_decision
 import torch.nn.functional as F
 
 # import lpips
@@ -43,6 +44,9 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
                          gaussians, scene, tb_writer, train_iter, timer):
     first_iter = 0
     gaussians.training_setup(opt)
+    print(gaussians.memory_report())
+    if opt.max_gaussians > 0:
+        print(gaussians.memory_report(opt.max_gaussians))
     if checkpoint:
         (model_params, first_iter) = torch.load(checkpoint)
         gaussians.restore(model_params, opt)
@@ -76,6 +80,8 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
 
         idx = randint(0, len(viewpoint_stack)-1)
         viewpoint_cams = [viewpoint_stack[idx]]
+        gaussians.sample_deformation_stats(iteration)
+        gaussians.sample_kernel_scores(iteration)
 
         # Render
         if (iteration - 1) == debug_from:
@@ -159,7 +165,9 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
             if iteration < opt.densify_until_iter :
                 # Keep track of max radii in image-space for pruning
                 gaussians.max_radii2D[visibility_filter] = torch.max(gaussians.max_radii2D[visibility_filter], radii[visibility_filter])
-                gaussians.add_densification_stats(viewspace_point_tensor_grad, visibility_filter)
+                scheduler = gaussians.densification_scheduler
+                if scheduler is None or not scheduler.converged:
+                    gaussians.add_densification_stats(viewspace_point_tensor_grad, visibility_filter)
 
   
                 opacity_threshold = opt.opacity_threshold_fine_init - iteration*(opt.opacity_threshold_fine_init - opt.opacity_threshold_fine_after)/(opt.densify_until_iter)  
@@ -167,11 +175,16 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
 
                 if iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0 :
                     size_threshold = 20 if iteration > opt.opacity_reset_interval else None
+                    if opt.deformation_table_threshold > 0:
+                        gaussians.update_deformation_table(opt.deformation_table_threshold, opt.deformation_promote_threshold)
                     gaussians.densify(densify_threshold, opacity_threshold, scene.cameras_extent, size_threshold)
                     
                 if iteration > opt.pruning_from_iter and iteration % opt.pruning_interval == 0:
                     size_threshold = 40 if iteration > opt.opacity_reset_interval else None
                     gaussians.prune(densify_threshold, opacity_threshold, scene.cameras_extent, size_threshold)
+
+                if scheduler is not None:
+                    densification_report(tb_writer, iteration, scheduler.pop_decisions(), gaussians.get_xyz.shape[0])
                     
                 if iteration % opt.opacity_reset_interval == 0 or (dataset.white_background and iteration == opt.densify_from_iter):
                     print("reset opacity")
@@ -179,9 +192,15 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
                     
             # Optimizer step
             if iteration < opt.iterations:
-                gaussians.optimizer.step()
+                if gaussians.sparse_adam:
+                    gaussians.optimizer.step(visibility=visibility_filter)
+                else:
+                    gaussians.optimizer.step()
                 gaussians.optimizer.zero_grad(set_to_none = True)
 
+            if gaussians.sparse_topk > 0 and iteration >= opt.sparsify_from_iter and iteration % opt.sparsify_interval == 0:
+                gaussians.sparsify_deformation()
+
             if (iteration in checkpoint_iterations):
                 print("\n[ITER {}] Saving Checkpoint".format(iteration))
                 torch.save((gaussians.capture(), iteration), scene.model_path + "/chkpnt" + str(iteration) + ".pth")
@@ -212,6 +231,19 @@ def prepare_output_and_logger(expname):
         print("Tensorboard not available: not logging progress")
     return tb_writer
 
+def densification_report(tb_writer, iteration, decisions, num_points):
+    # every scheduler decision goes to tensorboard, skipped densification passes and convergence are also printed
+    for decision in decisions:
+        if tb_writer:
+            tb_writer.add_scalar('densification/{}_run'.format(decision["pass"]), float(decision["decision"] == "run"), iteration)
+            for key in ("candidate_fraction", "growth", "prune_fraction"):
+                if key in decision:
+                    tb_writer.add_scalar('densification/' + key, decision[key], iteration)
+        if decision["pass"] == "densify" and (decision["decision"] == "skip" or decision.get("converged", False)):
+            print("\n[ITER {}] {}, {} Gaussians".format(iteration, format_decision(decision), num_points))
+    if decisions and tb_writer:
+        tb_writer.add_scalar('densification/num_points', num_points, iteration)
+
 def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_iterations, scene : Scene, renderFunc, renderArgs):
     
     if tb_writer:
@@ -93,4 +93,39 @@ def fov2focal(fov, pixels):
     return pixels / (2 * math.tan(fov / 2))
 
 def focal2fov(focal, pixels):
-    return 2*math.atan(pixels/(2*focal))
\ No newline at end of file
+    return 2*math.atan(pixels/(2*focal))
+
+
+def frustum_planes(world_view_transform, full_proj_transform, znear=0.2, guard_band=1.3):
+    # clip planes [5, 4] as (a, d) with a.x + d >= 0 inside; the near plane is the one the rasterizer culls on,
+    # the x/y planes are widened by guard_band (the rasterizer itself does not cull on them)
+    x, y, w = full_proj_transform[:, 0], full_proj_transform[:, 1], full_proj_transform[:, 3]
+    near = world_view_transform[:, 2].clone()
+    near[3] -= znear
+    return torch.stack((x + guard_band * w, guard_band * w - x, y + guard_band * w, guard_band * w - y, near))
+
+
+def aabb_in_frustum(lower, upper, planes):
+    # boxes [N, 3] that are not completely outside one of the planes
+    center = (lower + upper) / 2
+    half_extent = (upper - lower) / 2
+    dist = center @ planes[:, :3].T + half_extent @ planes[:, :3].abs().T + planes[:, 3]
+    return (dist >= 0).all(-1)
+
+
+def _part1by2(x):
+    # spread the low 21 bits of x so that two zero bits follow every bit
+    x = x & 0x1fffff
+    x = (x | x << 32) & 0x1f00000000ffff
+    x = (x | x << 16) & 0x1f0000ff0000ff
+    x = (x | x << 8) & 0x100f00f00f00f00f
+    x = (x | x << 4) & 0x10c30c30c30c30c3
+    x = (x | x << 2) & 0x1249249249249249
+    return x
+
+def morton_codes(points, bits=21):
+    # 3D Z-order codes [N] (int64) of points [N, 3], quantized to 2^bits cells per axis of their bounding box
+    lower = points.min(0).values
+    extent = (points.max(0).values - lower).clamp(min=1e-12)
+    cells = ((points - lower) / extent * (2**bits - 1)).long()
+    return _part1by2(cells[:, 0]) | (_part1by2(cells[:, 1]) << 1) | (_part1by2(cells[:, 2]) << 2)